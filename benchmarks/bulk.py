@@ -0,0 +1,118 @@
+"""Measure renaming and clearing a large board, and undoing both, on boards of two sizes.
+Every item of the board is changed one by one, which must not take longer per item the larger the board is,
+so this fails if the time per item grows by more than a factor from the smaller board to the larger one
+(a cost growing with the square of the size grows by 4).
+
+Usage: python benchmarks/bulk.py [--size <n>] [--max-growth <factor>]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def timed(function, *args):
+    from noteboard.storage import Storage
+
+    with Storage() as s:
+        start = time.perf_counter()
+        function(s, *args)
+        return time.perf_counter() - start
+
+
+def rename(s, board, new):
+    with s.transaction():
+        s.rename_board(board, new)
+        s.write_history("rename", "renamed board [{}] to [{}]".format(board, new))
+
+
+def clear(s, board):
+    with s.transaction():
+        amt = s.clear_board(board)
+        s.write_history("clear", "cleared {} items on board [{}]".format(amt, board))
+
+
+def undo(s):
+    s.history.revert([next(s.history.iter_undoable())])
+
+
+def bench(size):
+    """Time every action on a board of `size` items.
+
+    Returns:
+        list -- tuples of the name of every action and its seconds per item
+    """
+    from noteboard.storage import Storage
+
+    board, renamed = "Board {}".format(size), "Renamed {}".format(size)
+    with Storage() as s:
+        s.add_items({"text": "item {}".format(i), "board": board} for i in range(size))
+    results = [
+        ("rename", timed(rename, board, renamed)),
+        ("clear", timed(clear, renamed)),
+        ("undo clear", timed(undo)),
+        ("undo rename", timed(undo)),
+    ]
+    with Storage(readonly=True) as s:
+        restored = len(s.get_board(board))
+    if restored != size:
+        print("FAIL: {} of {} items restored by undoing".format(restored, size))
+        sys.exit(1)
+    return [(name, elapsed / size) for name, elapsed in results]
+
+
+def run(size):
+    """Run `bench` on a fresh store of its own, which the other size does not add to.
+
+    Returns:
+        list -- tuples of the name of every action and its seconds per item
+    """
+    home = tempfile.mkdtemp(prefix="noteboard-bench-")
+    env = dict(os.environ)
+    env["HOME"] = home
+    env["PYTHONPATH"] = ROOT
+    try:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--bench", str(size)], env=env,
+                                stdout=subprocess.PIPE, universal_newlines=True)
+    finally:
+        shutil.rmtree(home)
+    if result.returncode != 0:
+        print(result.stdout, end="")
+        sys.exit(1)
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure renaming and clearing a large board")
+    parser.add_argument("--size", help="amount of items on the larger board, of which the smaller one has a quarter (default: 20000)",
+                        type=int, default=20000)
+    parser.add_argument("--max-growth", help="maximum factor of the time per item from the smaller board to the larger one (default: 2)",
+                        type=float, default=2)
+    parser.add_argument("--bench", help=argparse.SUPPRESS, type=int)
+    args = parser.parse_args()
+
+    if args.bench:
+        # run by `run` with $HOME of the store
+        json.dump(bench(args.bench), sys.stdout)
+        return
+
+    small, large = args.size // 4, args.size
+    failed = False
+    print("{:<12} {:>14} {:>14} {:>8}".format("action", "{} items".format(small), "{} items".format(large), "growth"))
+    for (name, before), (_, after) in zip(run(small), run(large)):
+        growth = after / before
+        print("{:<12} {:>12.1f}us {:>12.1f}us {:>7.2f}x".format(name, before * 1e6, after * 1e6, growth))
+        if growth > args.max_growth:
+            print("FAIL: the time per item of {} grows by more than {:.1f}x".format(name, args.max_growth))
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Measure the throughput of exporting and importing every archive format.
+
+Usage: python benchmarks/export.py [<size> ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+# isolate the storage before noteboard reads the configurations
+os.environ["HOME"] = tempfile.mkdtemp(prefix="noteboard-bench-")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from noteboard.archive import FORMATS  # noqa: E402
+from noteboard.storage import Storage  # noqa: E402
+
+
+def fill(size):
+    with Storage() as s:
+        s.clear_board()
+        for i in range(size):
+            s.add_item("Board {}".format(i % 10), "item {} with some text".format(i))
+
+
+def bench(size, format, compress):
+    path = os.path.join(os.environ["HOME"], "board.{}{}".format(format, ".gz" if compress else ""))
+    with Storage(readonly=True) as s:
+        start = time.perf_counter()
+        s.export(path, format=format, compress=compress)
+        exported = time.perf_counter() - start
+    with Storage() as s:
+        start = time.perf_counter()
+        s.import_(path)
+        imported = time.perf_counter() - start
+    return size / exported, size / imported, os.path.getsize(path) / 1e6
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 20000]
+    print("{:>10}  {:>12}  {:>14}  {:>14}  {:>8}".format("items", "format", "export items/s", "import items/s", "MB"))
+    for size in sizes:
+        fill(size)
+        for format in FORMATS:
+            for compress in (False, True):
+                print("{:>10}  {:>12}  {:>14.0f}  {:>14.0f}  {:>8.2f}".format(size, format + (" gz" if compress else ""), *bench(size, format, compress)))
+
+
+if __name__ == "__main__":
+    main()
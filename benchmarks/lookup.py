@@ -0,0 +1,44 @@
+"""Measure the cost of looking up items by id as the store grows.
+
+Usage: python benchmarks/lookup.py [<size> ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# isolate the storage before noteboard reads the configurations
+os.environ["HOME"] = tempfile.mkdtemp(prefix="noteboard-bench-")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from noteboard.storage import Storage  # noqa: E402
+
+LOOKUPS = 1000
+
+
+def bench(size):
+    with Storage() as s:
+        s.clear_board()
+        for i in range(size):
+            s.add_item("Board {}".format(i % 10), "item {}".format(i))
+    with Storage() as s:
+        # ids are never reused, so they keep growing across sizes
+        ids = random.choices(list(s.items), k=LOOKUPS)
+        start = time.perf_counter()
+        for id in ids:
+            s.get_item(id)
+            s.modify_item(id, "tick", True)
+        elapsed = time.perf_counter() - start
+    return elapsed / LOOKUPS * 1e6
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    print("{:>10}  {:>14}".format("items", "us / lookup"))
+    for size in sizes:
+        print("{:>10}  {:>14.2f}".format(size, bench(size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compare searching items through the inverted index with scanning every item.
+
+Usage: python benchmarks/search.py [<size> ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# isolate the storage before noteboard reads the configurations
+os.environ["HOME"] = tempfile.mkdtemp(prefix="noteboard-bench-")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from noteboard.index import words  # noqa: E402
+from noteboard.storage import Storage  # noqa: E402
+
+QUERIES = 50
+VOCABULARY = ["word{}".format(i) for i in range(2000)]
+TAGS = ["bug", "idea", "chore", "urgent", ""]
+
+
+def fill(size):
+    random.seed(size)
+    with Storage() as s:
+        s.clear_board()
+        for i in range(size):
+            item = s.add_item("Board {}".format(i % 10), " ".join(random.sample(VOCABULARY, 5)))
+            s.modify_item(item.id, "tag", random.choice(TAGS))
+
+
+def measure(search, queries):
+    start = time.perf_counter()
+    for text, tag in queries:
+        search(text, tag)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def bench(size):
+    fill(size)
+    queries = [(" ".join(random.sample(VOCABULARY, random.randint(1, 2))), random.choice([None, "bug"])) for _ in range(QUERIES)]
+    with Storage(readonly=True) as s:
+        # the first search pays for loading the index and the boards from the disk
+        first = measure(lambda text, tag: s.search(text, tag=tag), queries[:1])
+        indexed = measure(lambda text, tag: s.search(text, tag=tag), queries)
+        scanned = measure(lambda text, tag: s._scan(words(text), tag=tag), queries)
+    return first, indexed, scanned
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    print("{:>10}  {:>14}  {:>14}  {:>14}".format("items", "ms first", "ms / search", "ms / scan"))
+    for size in sizes:
+        print("{:>10}  {:>14.3f}  {:>14.3f}  {:>14.3f}".format(size, *bench(size)))
+
+
+if __name__ == "__main__":
+    main()
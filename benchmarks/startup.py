@@ -0,0 +1,65 @@
+"""Measure the time of importing the CLI with `python -X importtime` and fail if it exceeds a budget,
+or if any module which should only be imported when needed is imported at startup.
+
+Usage: python benchmarks/startup.py [--budget <ms>] [--runs <n>]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# modules which are only needed by some commands or backends
+DEFERRED = ("shelve", "dbm", "sqlite3", "pickle", "tarfile", "gzip", "shutil", "tempfile", "subprocess", "urllib.parse", "socket", "cProfile", "noteboard.archive", "noteboard.server")
+
+
+def import_times(env):
+    """Import the CLI in a new interpreter and get the cumulative import time of every module in microseconds."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import noteboard.__main__"],
+                            cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the CLI")
+    parser.add_argument("--budget", help="maximum import time in milliseconds (default: 40)", type=float, default=40)
+    parser.add_argument("--runs", help="amount of runs, of which the fastest one is taken (default: 10)", type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # isolate the storage and the configurations, and cache the bytecode so that compiling is not measured
+    env["HOME"] = tempfile.mkdtemp(prefix="noteboard-bench-")
+    env["PYTHONPYCACHEPREFIX"] = tempfile.mkdtemp(prefix="noteboard-bench-")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    import_times(env)  # warm up
+
+    runs = [import_times(env) for _ in range(args.runs)]
+    fastest = min(runs, key=lambda times: times["noteboard.__main__"])
+    total = fastest["noteboard.__main__"] / 1000
+
+    print("Slowest imports:")
+    for name, us in sorted(fastest.items(), key=lambda item: item[1], reverse=True)[1:11]:
+        print("  {:>8.2f} ms  {}".format(us / 1000, name))
+    print("Import time of noteboard.__main__: {:.2f} ms (budget: {:.2f} ms)".format(total, args.budget))
+
+    failed = False
+    imported = [name for name in DEFERRED if name in fastest]
+    if imported:
+        print("FAIL: modules imported at startup: {}".format(", ".join(imported)))
+        failed = True
+    if total > args.budget:
+        print("FAIL: import time exceeds the budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
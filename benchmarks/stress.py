@@ -0,0 +1,72 @@
+"""Run many `board add` and `board tick` commands in parallel processes and check that no change is lost.
+
+Usage: python benchmarks/stress.py [--adds <n>] [--ticks <n>] [--workers <n>] [--backend {shelve,sqlite}]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def board(env, *args):
+    return subprocess.run([sys.executable, "-m", "noteboard"] + list(args), cwd=ROOT, env=env, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that parallel commands do not lose any changes")
+    parser.add_argument("--adds", help="amount of items to add in parallel (default: 200)", type=int, default=200)
+    parser.add_argument("--ticks", help="amount of items to tick in parallel (default: 200)", type=int, default=200)
+    parser.add_argument("--workers", help="amount of commands running at the same time (default: 16)", type=int, default=16)
+    parser.add_argument("--backend", help="storage backend (default: shelve)", choices=("shelve", "sqlite"), default="shelve")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # isolate the storage and the configurations
+    env["HOME"] = tempfile.mkdtemp(prefix="noteboard-stress-")
+    env["PYTHONPATH"] = ROOT
+    with open(os.path.join(env["HOME"], ".noteboard.json"), "w") as f:
+        json.dump({"StorageBackend": args.backend}, f)
+
+    # items to be ticked, added in one go
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("".join("tick me {}\n".format(i) for i in range(args.ticks)))
+    if args.ticks:
+        board(env, "add", "-f", f.name, "-b", "Ticks")
+    os.remove(f.name)
+
+    commands = [("add", "stress item {}".format(i), "-b", "Adds") for i in range(args.adds)]
+    commands += [("tick", str(id)) for id in range(1, args.ticks + 1)]
+    commands.sort(key=lambda command: hash(command))  # interleave the adds and the ticks
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as pool:
+        results = list(pool.map(lambda command: board(env, *command), commands))
+    elapsed = time.perf_counter() - start
+
+    failed = [(command, result.stdout.strip()) for command, result in zip(commands, results) if result.returncode != 0 or "✘" in result.stdout]
+    export = os.path.join(env["HOME"], "board.json")
+    board(env, "export", "-d", export)
+    with open(export) as f:
+        boards = json.load(f)
+    added = {item["text"] for item in boards.get("Adds", [])}
+    ticked = [item for item in boards.get("Ticks", []) if item["tick"]]
+    lost_adds = args.adds - len(added)
+    lost_ticks = args.ticks - len(ticked)
+
+    print("{} commands by {} workers in {:.1f}s ({:.1f} commands/s)".format(len(commands), args.workers, elapsed, len(commands) / elapsed))
+    print("Failed commands: {}".format(len(failed)))
+    for command, output in failed[:5]:
+        print("  board {}: {}".format(" ".join(command), output.splitlines()[-1] if output else ""))
+    print("Lost adds: {} of {}".format(lost_adds, args.adds))
+    print("Lost ticks: {} of {}".format(lost_ticks, args.ticks))
+    sys.exit(1 if failed or lost_adds or lost_ticks else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Time every command end to end, and the methods of the storage and the history directly,
+over synthetic stores of several sizes. Every run works on a fresh copy of the store in a temporary directory.
+
+Results are written as JSON, which can be saved as a baseline and compared with later results
+to flag the benchmarks which became slower.
+
+Usage: python benchmarks/suite.py [--sizes <n> ...] [--runs <n>] [--backend {shelve,sqlite}]
+                                  [--output <path>] [--compare <baseline>] [--threshold <ratio>]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BOARDS = 10
+TAGS = ("bug", "idea", "chore", "later")
+WORDS = ("write", "read", "fix", "test", "call", "buy", "plan", "review", "clean", "ship", "docs", "release", "email", "meeting")
+LOOKUPS = 1000
+# changes smaller than this amount of seconds are noise, however large the ratio is
+NOISE = 0.002
+
+
+def generate(path, size, seed):
+    """Write a store of `size` items as an NDJSON archive, which is the same for the same seed."""
+    rng = random.Random(seed)
+    today = int(datetime.datetime.combine(datetime.date.today(), datetime.time()).timestamp())
+    start = today - size * 60
+    with open(path, "w") as f:
+        for id in range(1, size + 1):
+            item = {
+                "board": "Board {}".format(id % BOARDS),
+                "id": id,
+                "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) + " {}".format(id),
+                "time": start + id * 60,
+                "due": today + rng.randint(-30, 30) * 86400 if rng.random() < 0.1 else None,
+                "tick": rng.random() < 0.3,
+                "mark": rng.random() < 0.05,
+                "star": rng.random() < 0.05,
+                "tag": rng.choice(TAGS) if rng.random() < 0.2 else "",
+            }
+            f.write(json.dumps(item) + "\n")
+
+
+def environ(home):
+    env = dict(os.environ)
+    env["HOME"] = home
+    env["PYTHONPATH"] = ROOT
+    return env
+
+
+def board(home, args, input=None):
+    """Run a command and get the seconds it took."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", "noteboard"] + [str(arg) for arg in args], cwd=home, env=environ(home), input=input,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0 or "✘" in result.stdout:
+        raise RuntimeError("board {} failed: {}".format(" ".join(map(str, args)), result.stdout.strip()[-500:]))
+    return elapsed
+
+
+def seed(home, size, backend):
+    """Make a store of `size` items in `home`, without any history."""
+    with open(os.path.join(home, ".noteboard.json"), "w") as f:
+        json.dump({"StorageBackend": backend}, f)
+    archive = os.path.join(home, "seed.ndjson")
+    generate(archive, size, seed=size)
+    elapsed = board(home, ["import", archive])
+    os.remove(archive)
+    directory = os.path.join(home, ".noteboard")
+    for name in os.listdir(directory):
+        if name.startswith("history."):
+            os.remove(os.path.join(directory, name))
+    return elapsed
+
+
+def bench_commands(home, size):
+    """Time every command once on the store, each of them changing the store left by the previous one.
+
+    Returns:
+        dict -- seconds of every command
+    """
+    id = size // 2 or 1
+    archive = os.path.join(home, "board.json")
+    commands = [
+        ("list", []),
+        ("timeline", ["-t"]),
+        ("add", ["add", "benchmark item"]),
+        ("tick", ["tick", id]),
+        ("move", ["move", id, "-b", "Moved"]),
+        ("remove", ["remove", id]),
+        ("undo", ["undo"]),
+        ("history", ["history"]),
+        ("export", ["export", "-d", archive]),
+        ("import", ["import", archive]),
+    ]
+    return {"cli." + name: board(home, args, input="y\n" if name == "undo" else None) for name, args in commands}
+
+
+def bench_api(runs):
+    """Time the methods of the storage and the history in this process, on the store of $HOME.
+
+    Returns:
+        dict -- seconds of every run of every benchmark
+    """
+    from noteboard.storage import Storage, History
+
+    def timed(function):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+    def open_close():
+        with Storage(readonly=True):
+            pass
+
+    # the same as the commands, in a transaction which is written to the history
+    def add_item():
+        with Storage() as s, s.transaction():
+            item = s.add_item("Benchmark", "benchmark item")
+            s.write_history("add", "added item {} [{}] to board [Benchmark]".format(item.id, item.text))
+
+    def tick_item():
+        with Storage() as s, s.transaction():
+            state = not s.get_item(id).tick
+            s.modify_item(id, "tick", state)
+            s.write_history("tick" if state else "untick", "ticked item {}".format(id))
+
+    def latest():
+        History.latest(20)
+
+    def undoable():
+        next(History(None).iter_undoable(), None)
+
+    def all_entries():
+        for _ in History.iter_entries():
+            pass
+
+    results = {}
+    with Storage(readonly=True) as s:
+        ids = [item.id for item in s.get_all_items()]
+        rng = random.Random(len(ids))
+        id = rng.choice(ids)
+        lookups = [rng.choice(ids) for _ in range(LOOKUPS)]
+        in_session = {
+            "api.get_item x{}".format(LOOKUPS): lambda: [s.get_item(i) for i in lookups],
+            "api.iter_boards": lambda: sum(1 for _, _, items in s.iter_boards() for _ in items),
+            "api.iter_timeline": lambda: sum(len(items) for _, items in s.iter_timeline()),
+            "api.search": lambda: list(s.search("review ship")),
+            "api.query": lambda: list(s.query(["mark", "tag=bug", "or", "star"])),
+            "api.due_items": lambda: list(s.due_items()),
+        }
+        for name, function in in_session.items():
+            results[name] = [timed(function) for _ in range(runs)]
+    sessions = {
+        "api.open_close": open_close,
+        "api.add_item": add_item,
+        "api.tick_item": tick_item,
+        "api.history_latest": latest,
+        "api.history_undoable": undoable,
+        "api.history_entries": all_entries,
+    }
+    for name, function in sessions.items():
+        results[name] = [timed(function) for _ in range(runs)]
+    return results
+
+
+def summarize(runs):
+    return {"median": statistics.median(runs), "min": min(runs), "runs": runs}
+
+
+def bench_size(workdir, size, runs, backend):
+    """Run all benchmarks on a store of `size` items.
+
+    Returns:
+        dict -- summary of every benchmark
+    """
+    origin = os.path.join(workdir, "seed-{}".format(size))
+    os.makedirs(origin)
+    print("Seeding {} items...".format(size), flush=True)
+    seeded = seed(origin, size, backend)
+    timings = {}
+    for run in range(runs):
+        home = os.path.join(workdir, "run")
+        shutil.copytree(origin, home)
+        try:
+            for name, elapsed in bench_commands(home, size).items():
+                timings.setdefault(name, []).append(elapsed)
+        finally:
+            shutil.rmtree(home)
+    home = os.path.join(workdir, "run")
+    shutil.copytree(origin, home)
+    try:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--api", "--runs", str(runs)], cwd=home, env=environ(home),
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        timings.update(json.loads(result.stdout))
+    finally:
+        shutil.rmtree(home)
+        shutil.rmtree(origin)
+    results = {"seed": {"median": seeded, "min": seeded, "runs": [seeded]}}
+    results.update((name, summarize(runs)) for name, runs in timings.items())
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Print the changes of the fastest runs from the baseline, which are the least disturbed by other processes.
+
+    Returns:
+        list -- (size, name) of the benchmarks which became slower by more than `threshold`
+    """
+    regressions = []
+    print()
+    print("{:>8}  {:<24} {:>10} {:>10} {:>8}".format("size", "benchmark", "baseline", "current", "change"))
+    for size, results in current["results"].items():
+        for name, result in results.items():
+            base = baseline["results"].get(size, {}).get(name)
+            if base is None:
+                continue
+            old, new = base["min"], result["min"]
+            change = (new - old) / old if old else 0
+            flag = ""
+            if change > threshold and new - old > NOISE:
+                regressions.append((size, name))
+                flag = "  REGRESSION"
+            print("{:>8}  {:<24} {:>9.1f}ms {:>9.1f}ms {:>+7.0%}{}".format(size, name, old * 1000, new * 1000, change, flag))
+    return regressions
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the commands and the storage over synthetic stores")
+    parser.add_argument("--sizes", help="amounts of items of the stores (default: 1000 10000 100000)", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", help="amount of runs of every benchmark, of which the fastest one is compared (default: 3)", type=int, default=3)
+    parser.add_argument("--backend", help="storage backend (default: shelve)", choices=("shelve", "sqlite"), default="shelve")
+    parser.add_argument("-o", "--output", help="path of the JSON results (default: benchmark.json)", default="benchmark.json")
+    parser.add_argument("--compare", help="path of the JSON results of a baseline to compare with", metavar="<baseline>")
+    parser.add_argument("--threshold", help="ratio of slowing down which is a regression (default: 0.2)", type=float, default=0.2)
+    parser.add_argument("--api", help=argparse.SUPPRESS, default=False, action="store_true")
+    args = parser.parse_args()
+
+    if args.api:
+        # run by `bench_size` with $HOME of the store
+        json.dump(bench_api(args.runs), sys.stdout)
+        return
+    baseline = None
+    if args.compare:
+        # fail before spending the time on the benchmarks
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix="noteboard-bench-")
+    # cache the bytecode so that compiling is not measured, which is inherited by the commands
+    os.environ["PYTHONPYCACHEPREFIX"] = os.path.join(workdir, "pycache")
+    os.environ.pop("PYTHONDONTWRITEBYTECODE", None)
+    current = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "runs": args.runs,
+        },
+        "results": {},
+    }
+    try:
+        for size in args.sizes:
+            results = bench_size(workdir, size, args.runs, args.backend)
+            current["results"][str(size)] = results
+            for name, result in results.items():
+                print("  {:<24} {:>9.1f}ms".format(name, result["min"] * 1000))
+    finally:
+        shutil.rmtree(workdir)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print("Results written to {}".format(args.output))
+
+    if baseline is not None:
+        regressions = compare(baseline, current, args.threshold)
+        print()
+        print("Regressions: {}".format(len(regressions)))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,39 @@
 # Prepare directory paths
 import os
 
-from .utils import init_config, load_config, setup_logger
+from .utils import load_config, setup_logger
 
 
 CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".noteboard.json")
 
-if not os.path.isfile(CONFIG_PATH):
-    init_config(CONFIG_PATH)
-
-
 DIR_PATH = os.path.join(os.path.expanduser("~"), ".noteboard/")
+# configurations are only read here, nothing is written until the storage is accessed
 config = load_config(CONFIG_PATH)
 
 path = config.get("StoragePath") or DIR_PATH
 path = os.path.expanduser(path)
-if not os.path.isdir(path):
-    os.mkdir(path)
 
 LOG_PATH = os.path.join(path, "noteboard.log")
-HISTORY_PATH = os.path.join(path, "history.json.gz")
+HISTORY_PATH = os.path.join(path, "history.jsonl")
+LEGACY_HISTORY_PATH = os.path.join(path, "history.json.gz")
 STORAGE_PATH = os.path.join(path, "storage")
 STORAGE_GZ_PATH = os.path.join(path, "storage.gz")
+STORAGE_DB_PATH = os.path.join(path, "storage.sqlite3")
+SOCKET_PATH = os.path.join(path, "noteboard.sock")
 
 DEFAULT_BOARD = (config.get("DefaultBoardName") or "Board").strip()
 TAGS = config.get("Tags", {"default": "BLUE"})
-
-setup_logger(LOG_PATH)
+BACKEND = config.get("StorageBackend") or "shelve"
+# limits of the history, which are not set by default
+HISTORY_RETENTION = {
+    "entries": config.get("HistoryMaxEntries"),
+    "days": config.get("HistoryMaxDays"),
+    "size": config.get("HistoryMaxBytes"),
+}
+
+
+def prepare():
+    """Create the storage directory and set up the log file, before the storage is accessed."""
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    setup_logger(LOG_PATH)
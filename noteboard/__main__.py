@@ -1,17 +1,27 @@
 import argparse
+import datetime
+import json
 import sys
 import os
 import re
 import shlex
+import time
 import logging
 from colorama import init, deinit, Fore, Back, Style
 
-from . import DEFAULT_BOARD, TAGS
+from . import CONFIG_PATH, SOCKET_PATH, DEFAULT_BOARD, BACKEND, HISTORY_RETENTION, prepare
 from .__version__ import __version__
-from .storage import Storage, History, NoteboardException
-from .utils import time_diff, add_date, to_timestamp, to_datetime
+from .storage import Storage, History, NoteboardException, BoardNotFoundError
+from .backends import BACKENDS, get_backend
+from .render import Renderer, get_tag_color
+from .profiling import phase
+from .utils import add_date, to_timestamp, to_datetime, load_config, save_config
 
 logger = logging.getLogger("noteboard")
+PAGE_SIZE = 20
+COMMANDS = ("add", "remove", "clear", "tick", "mark", "star", "edit", "tag", "due", "run", "move", "rename", "undo", "redo", "import", "export", "migrate", "search", "query", "upcoming", "overdue", "history", "serve")
+# options of the main parser which take a value
+VALUE_OPTIONS = ("--since", "--until", "--board", "--limit", "--offset", "--page", "--profile-dump")
 COLORS = {
     "add": "GREEN",
     "remove": "LIGHTMAGENTA_EX",
@@ -32,8 +42,11 @@ COLORS = {
     "move": "LIGHTCYAN_EX",
     "rename": "LIGHTCYAN_EX",
     "undo": "LIGHTCYAN_EX",
+    "redo": "LIGHTCYAN_EX",
     "import": "",
     "export": "",
+    "migrate": "LIGHTCYAN_EX",
+    "serve": "LIGHTCYAN_EX",
 }
 
 
@@ -42,6 +55,13 @@ def p(*args, **kwargs):
     print(" ", *args, **kwargs)
 
 
+def print_changes(messages):
+    # the messages of a transaction are printed once it is committed, as a failing change rolls back all the others
+    print()
+    for message in messages:
+        p(*message)
+
+
 def error_print(text):
     print(Style.BRIGHT + Fore.LIGHTRED_EX + "✘ " + text)
 
@@ -60,25 +80,8 @@ def get_back_color(action):
     return eval("Back." + color)
 
 
-def print_footer():
-    with Storage() as s:
-        shelf = dict(s.shelf)
-    ticks = 0
-    marks = 0
-    stars = 0
-    for board in shelf:
-        for item in shelf[board]:
-            if item["tick"] is True:
-                ticks += 1
-            if item["mark"] is True:
-                marks += 1
-            if item["star"] is True:
-                stars += 1
-    p(Fore.GREEN + str(ticks), Fore.LIGHTBLACK_EX + "done •", Fore.LIGHTRED_EX + str(marks), Fore.LIGHTBLACK_EX + "marked •", Fore.LIGHTYELLOW_EX + str(stars), Fore.LIGHTBLACK_EX + "starred")
-
-
 def print_total():
-    with Storage() as s:
+    with Storage(readonly=True) as s:
         total = s.total
     p(Fore.LIGHTCYAN_EX + "Total Items:", Style.DIM + str(total))
 
@@ -86,16 +89,16 @@ def print_total():
 def run(args):
     color = get_fore_color("run")
     item = args.item
-    with Storage() as s:
+    with Storage(readonly=True) as s:
         i = s.get_item(item)
     # Run
     import subprocess
-    cmd = shlex.split(i["text"])
+    cmd = shlex.split(i.text)
     if "|" in cmd:
-        command = i["text"]
+        command = i.text
         shell = True
     elif len(cmd) == 1:
-        command = i["text"]
+        command = i.text
         shell = True
     else:
         command = cmd
@@ -104,26 +107,75 @@ def run(args):
     process = subprocess.Popen(command, shell=shell, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE, executable=execuatble)
     # Live stdout output
     deinit()
-    print(color + "[>] Running item" + Fore.RESET, Style.BRIGHT + str(i["id"]) + Style.RESET_ALL, color + "as command...\n" + Fore.RESET)
+    print(color + "[>] Running item" + Fore.RESET, Style.BRIGHT + str(i.id) + Style.RESET_ALL, color + "as command...\n" + Fore.RESET)
     for line in iter(process.stdout.readline, b""):
         sys.stdout.write(line.decode("utf-8"))
     process.wait()
 
 
+def read_items(f, board=None):
+    """Read items to be added from lines of text, or JSON objects of the text, board, tag, due date and star of an item."""
+    for n, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("{"):
+            yield {"text": line, "board": board}
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            raise NoteboardException("Invalid JSON on line {}".format(n))
+        if not isinstance(data, dict) or not isinstance(data.get("text"), str):
+            raise NoteboardException("Missing text of item on line {}".format(n))
+        if data.get("board") is None:
+            data["board"] = board
+        elif not isinstance(data["board"], str):
+            raise NoteboardException("Invalid board on line {}".format(n))
+        tag = data.get("tag") or ""
+        if not isinstance(tag, str) or len(tag) > 10:
+            raise NoteboardException("Invalid tag on line {}".format(n))
+        data["tag"] = tag.strip().replace(" ", "-")
+        due = data.get("due")
+        if isinstance(due, str):
+            # a pattern like `board due --date`
+            date = parse_due(due)
+            if date is None:
+                raise NoteboardException("Invalid date pattern format on line {}".format(n))
+            data["due"] = to_timestamp(date)
+        elif due is not None and (not isinstance(due, int) or isinstance(due, bool)):
+            raise NoteboardException("Invalid due date on line {}".format(n))
+        if not isinstance(data.get("star", False), bool):
+            raise NoteboardException("Invalid star on line {}".format(n))
+        yield data
+
+
 def add(args):
     color = get_fore_color("add")
     items = args.item
     board = args.board
+    if not items and args.file is None:
+        error_print("Text must not be empty")
+        return
     print()
-    with Storage() as s:
+    with Storage() as s, s.transaction():
+        if args.file is not None:
+            path = "stdin" if args.file == "-" else os.path.abspath(args.file)
+            try:
+                f = sys.stdin if args.file == "-" else open(path, "r")
+            except FileNotFoundError:
+                raise NoteboardException("File not found ({})".format(path))
+            with f:
+                amt = s.add_items(read_items(f, board))
+            p(color + "[+] Added", Style.DIM + str(amt) + Style.RESET_ALL, color + "items from", Style.BRIGHT + path)
+            s.write_history("add", "added {} items from [{}]".format(amt, path))
         for item in items:
             if not item:
                 error_print("Text must not be empty")
                 return
-            s.save_history()
             i = s.add_item(board, item)
-            p(color + "[+] Added item", Style.BRIGHT + str(i["id"]), color + "to", Style.BRIGHT + (board or DEFAULT_BOARD))
-            s.write_history("add", "added item {} [{}] to board [{}]".format(str(i["id"]), item, (board or DEFAULT_BOARD)))
+            p(color + "[+] Added item", Style.BRIGHT + str(i.id), color + "to", Style.BRIGHT + (board or DEFAULT_BOARD))
+            s.write_history("add", "added item {} [{}] to board [{}]".format(str(i.id), item, (board or DEFAULT_BOARD)))
     print_total()
     print()
 
@@ -131,13 +183,13 @@ def add(args):
 def remove(args):
     color = get_fore_color("remove")
     items = args.item
-    print()
-    with Storage() as s:
+    messages = []
+    with Storage() as s, s.transaction():
         for item in items:
-            s.save_history()
             i, board = s.remove_item(item)
-            p(color + "[-] Removed item", Style.BRIGHT + str(i["id"]), color + "on", Style.BRIGHT + board)
-            s.write_history("remove", "removed item {} [{}] from board [{}]".format(str(i["id"]), item, (board or DEFAULT_BOARD)))
+            messages.append((color + "[-] Removed item", Style.BRIGHT + str(i.id), color + "on", Style.BRIGHT + board))
+            s.write_history("remove", "removed item {} [{}] from board [{}]".format(str(i.id), item, (board or DEFAULT_BOARD)))
+    print_changes(messages)
     print_total()
     print()
 
@@ -145,19 +197,18 @@ def remove(args):
 def clear(args):
     color = get_fore_color("clear")
     boards = args.board
-    print()
-    with Storage() as s:
+    messages = []
+    with Storage() as s, s.transaction():
         if boards:
             for board in boards:
-                s.save_history()
                 amt = s.clear_board(board)
-                p(color + "[x] Cleared", Style.DIM + str(amt) + Style.RESET_ALL, color + "items on", Style.BRIGHT + board)
+                messages.append((color + "[x] Cleared", Style.DIM + str(amt) + Style.RESET_ALL, color + "items on", Style.BRIGHT + board))
                 s.write_history("clear", "cleared {} items on board [{}]".format(str(amt), board))
         else:
-            s.save_history()
             amt = s.clear_board(None)
-            p(color + "[x] Cleared", Style.DIM + str(amt) + Style.RESET_ALL, color + "items on all boards")
+            messages.append((color + "[x] Cleared", Style.DIM + str(amt) + Style.RESET_ALL, color + "items on all boards"))
             s.write_history("clear", "cleared {} items on all board".format(str(amt)))
+    print_changes(messages)
     print_total()
     print()
 
@@ -165,54 +216,54 @@ def clear(args):
 def tick(args):
     color = get_fore_color("tick")
     items = args.item
-    with Storage() as s:
-        print()
+    messages = []
+    with Storage() as s, s.transaction():
         for item in items:
-            state = not s.get_item(item)["tick"]
-            s.save_history()
+            state = not s.get_item(item).tick
             i = s.modify_item(item, "tick", state)
             if state is True:
-                p(color + "[✓] Ticked item", Style.BRIGHT + str(i["id"]), color)
-                s.write_history("tick", "ticked item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[✓] Ticked item", Style.BRIGHT + str(i.id), color))
+                s.write_history("tick", "ticked item {} [{}]".format(str(i.id), i.text))
             else:
-                p(color + "[✓] Unticked item", Style.BRIGHT + str(i["id"]), color)
-                s.write_history("untick", "unticked item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[✓] Unticked item", Style.BRIGHT + str(i.id), color))
+                s.write_history("untick", "unticked item {} [{}]".format(str(i.id), i.text))
+    print_changes(messages)
     print()
 
 
 def mark(args):
     color = get_fore_color("mark")
     items = args.item
-    with Storage() as s:
-        print()
+    messages = []
+    with Storage() as s, s.transaction():
         for item in items:
-            state = not s.get_item(item)["mark"]
-            s.save_history()
+            state = not s.get_item(item).mark
             i = s.modify_item(item, "mark", state)
             if state is True:
-                p(color + "[!] Marked item", Style.BRIGHT + str(i["id"]))
-                s.write_history("mark", "marked item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[!] Marked item", Style.BRIGHT + str(i.id)))
+                s.write_history("mark", "marked item {} [{}]".format(str(i.id), i.text))
             else:
-                p(color + "[!] Unmarked item", Style.BRIGHT + str(i["id"]))
-                s.write_history("unmark", "unmarked item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[!] Unmarked item", Style.BRIGHT + str(i.id)))
+                s.write_history("unmark", "unmarked item {} [{}]".format(str(i.id), i.text))
+    print_changes(messages)
     print()
 
 
 def star(args):
     color = get_fore_color("star")
     items = args.item
-    with Storage() as s:
-        print()
+    messages = []
+    with Storage() as s, s.transaction():
         for item in items:
-            state = not s.get_item(item)["star"]
-            s.save_history()
+            state = not s.get_item(item).star
             i = s.modify_item(item, "star", state)
             if state is True:
-                p(color + "[*] Starred item", Style.BRIGHT + str(i["id"]))
-                s.write_history("star", "starred item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[*] Starred item", Style.BRIGHT + str(i.id)))
+                s.write_history("star", "starred item {} [{}]".format(str(i.id), i.text))
             else:
-                p(color + "[*] Unstarred item", Style.BRIGHT + str(i["id"]))
-                s.write_history("unstar", "unstarred item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[*] Unstarred item", Style.BRIGHT + str(i.id)))
+                s.write_history("unstar", "unstarred item {} [{}]".format(str(i.id), i.text))
+    print_changes(messages)
     print()
 
 
@@ -226,9 +277,9 @@ def edit(args):
     with Storage() as s:
         s.save_history()
         i = s.modify_item(item, "text", text)
-        s.write_history("edit", "editted item {} from [{}] to [{}]".format(str(i["id"]), i["text"], text))
+        s.write_history("edit", "editted item {} from [{}] to [{}]".format(str(i.id), i.text, text))
     print()
-    p(color + "[~] Edited text of item", Style.BRIGHT + str(i["id"]), color + "from", i["text"], color + "to", text)
+    p(color + "[~] Edited text of item", Style.BRIGHT + str(i.id), color + "from", i.text, color + "to", text)
     print()
 
 
@@ -240,56 +291,61 @@ def tag(args):
         error_print("Tag text length should not be longer than 10 characters")
         return
     if text != "":
-        c = TAGS.get(text, "") or TAGS["default"]
-        tag_color = eval("Fore." + c.upper())
+        tag_color = get_tag_color(text)
         tag_text = text.replace(" ", "-")
     else:
         tag_text = ""
-    with Storage() as s:
-        print()
+    messages = []
+    with Storage() as s, s.transaction():
         for item in items:
-            s.save_history()
             i = s.modify_item(item, "tag", tag_text)
             if text != "":
-                p(color + "[#] Tagged item", Style.BRIGHT + str(i["id"]), color + "with", tag_color + tag_text)
-                s.write_history("tag", "tagged item {} [{}] with tag text [{}]".format(str(i["id"]), i["text"], text))
+                messages.append((color + "[#] Tagged item", Style.BRIGHT + str(i.id), color + "with", tag_color + tag_text))
+                s.write_history("tag", "tagged item {} [{}] with tag text [{}]".format(str(i.id), i.text, text))
             else:
-                p(color + "[#] Untagged item", Style.BRIGHT + str(i["id"]))
-                s.write_history("tag", "untagged item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[#] Untagged item", Style.BRIGHT + str(i.id)))
+                s.write_history("tag", "untagged item {} [{}]".format(str(i.id), i.text))
+    print_changes(messages)
     print()
 
 
+def parse_due(date):
+    # get the date of a pattern of `<digit><d|w>` from today, or None if the pattern is invalid
+    if not re.match(r"\d+[d|w]", date):
+        return None
+    days = 0
+    for m in re.findall(r"\d+[d|w]", date):
+        if m[-1] == "d":
+            days += int(m[:-1])
+        elif m[-1] == "w":
+            days += int(m[:-1]) * 7
+    return add_date(days)
+
+
 def due(args):
     color = get_fore_color("due")
     items = args.item
     date = args.date or ""
-    if date and not re.match(r"\d+[d|w]", date):
-        error_print("Invalid date pattern format")
-        return
-    match = re.findall(r"\d+[d|w]", date)
     if date:
-        days = 0
-        for m in match:
-            if m[-1] == "d":
-                days += int(m[:-1])
-            elif m[-1] == "w":
-                days += int(m[:-1]) * 7
-        duedate = add_date(days)
+        duedate = parse_due(date)
+        if duedate is None:
+            error_print("Invalid date pattern format")
+            return
         ts = to_timestamp(duedate)
     else:
         ts = None
 
-    with Storage() as s:
-        print()
+    messages = []
+    with Storage() as s, s.transaction():
         for item in items:
-            s.save_history()
             i = s.modify_item(item, "due", ts)
             if ts:
-                p(color + "[:] Assigned due date", duedate, color + "to", Style.BRIGHT + str(item))
-                s.write_history("due", "assiged due date [{}] to item {} [{}]".format(duedate, str(i["id"]), i["text"]))
+                messages.append((color + "[:] Assigned due date", duedate, color + "to", Style.BRIGHT + str(item)))
+                s.write_history("due", "assiged due date [{}] to item {} [{}]".format(duedate, str(i.id), i.text))
             else:
-                p(color + "[:] Unassigned due date of item", Style.BRIGHT + str(item))
-                s.write_history("due", "unassiged due date of item {} [{}]".format(str(i["id"]), i["text"]))
+                messages.append((color + "[:] Unassigned due date of item", Style.BRIGHT + str(item)))
+                s.write_history("due", "unassiged due date of item {} [{}]".format(str(i.id), i.text))
+    print_changes(messages)
     print()
 
 
@@ -297,13 +353,13 @@ def move(args):
     color = get_fore_color("move")
     items = args.item
     board = args.board
-    with Storage() as s:
-        print()
+    messages = []
+    with Storage() as s, s.transaction():
         for item in items:
-            s.save_history()
             i, b = s.move_item(item, board)
-            p(color + "[&] Moved item", Style.BRIGHT + str(i["id"]), color + "to", Style.BRIGHT + board)
-            s.write_history("move", "moved item {} [{}] from board [{}] to [{}]".format(str(i["id"]), i["text"], b, board))
+            messages.append((color + "[&] Moved item", Style.BRIGHT + str(i.id), color + "to", Style.BRIGHT + board))
+            s.write_history("move", "moved item {} [{}] from board [{}] to [{}]".format(str(i.id), i.text, b, board))
+    print_changes(messages)
     print()
 
 
@@ -316,42 +372,82 @@ def rename(args):
         return
     with Storage() as s:
         print()
-        s.get_board(board)  # try to get -> to test existence of the board
         s.save_history()
-        s.shelf[new] = s.shelf.pop(board)
+        s.rename_board(board, new)
         p(color + "[~] Renamed", Style.BRIGHT + board, color + "to", Style.BRIGHT + new)
         s.write_history("rename", "renamed board [{}] to [{}]".format(board, new))
     print()
 
 
-def undo(_):
+def undo(args):
     color = get_fore_color("undo")
+    if args.steps < 1:
+        error_print("Amount of actions must be positive")
+        return
     with Storage() as s:
-        all_hist = s.history.load()
-        hist = [i for i in all_hist if i["data"] is not None]
-        if len(hist) == 0:
+        states = []
+        for state in s.history.iter_undoable():
+            states.append(state)
+            if state["id"] == args.to or (args.to is None and len(states) == args.steps):
+                break
+        else:
+            if args.to is not None:
+                error_print("History entry [{}] cannot be undone".format(args.to))
+                return
+        if not states:
             error_print("Already at oldest change")
             return
-        state = hist[-1]
         print()
-        p(color + Style.BRIGHT + "Last Action:")
-        p("=>", get_fore_color(state["action"]) + state["info"])
+        p(color + Style.BRIGHT + ("Last Action:" if len(states) == 1 else "Last {} Actions:".format(len(states))))
+        for state in states:
+            p("=>", get_fore_color(state["action"]) + state["info"])
         print()
         ask = input("[?] Continue (y/n) ? ")
         if ask != "y":
             error_print("Operation aborted")
             return
-        s.history.revert()
-        print(color + "[^] Undone", "=>", get_fore_color(state["action"]) + state["info"])
+        s.history.revert(states)
+        for state in states:
+            print(color + "[^] Undone", "=>", get_fore_color(state["action"]) + state["info"])
+
+
+def redo(args):
+    color = get_fore_color("redo")
+    if args.steps < 1:
+        error_print("Amount of actions must be positive")
+        return
+    with Storage() as s:
+        redos = []
+        for redo in s.history.iter_redoable():
+            redos.append(redo)
+            if len(redos) == args.steps:
+                break
+        if not redos:
+            error_print("Already at newest change")
+            return
+        s.history.reapply(redos)
+        for redo in redos:
+            print(color + "[^] Redone", "=>", get_fore_color(redo["action"]) + redo["info"])
+
+
+def print_progress(count):
+    # overwrite the line of the last progress
+    sys.stdout.write("\r  " + get_fore_color("import") + "[I] Importing... " + Style.BRIGHT + str(count) + Style.RESET_ALL + " items")
+    sys.stdout.flush()
 
 
 def import_(args):
     color = get_fore_color("import")
     path = args.path
-    with Storage() as s:
-        s.save_history()
-        full_path = s.import_(path)
-        s.write_history("import", "imported boards from [{}]".format(full_path))
+    # only show the progress on a terminal
+    progress = print_progress if sys.stdout.isatty() else None
+    with Storage() as s, s.transaction():
+        try:
+            full_path = s.import_(path, merge=args.merge, progress=progress)
+        finally:
+            if progress is not None:
+                sys.stdout.write("\r\033[K")
+        s.write_history("import", "{} boards from [{}]".format("merged" if args.merge else "imported", full_path))
     print()
     p(color + "[I] Imported boards from", Style.BRIGHT + full_path)
     print_total()
@@ -361,6 +457,8 @@ def import_(args):
 def export(args):
     color = get_fore_color("export")
     dest = args.dest
+    if dest is None:
+        dest = "./board." + ("ndjson" if args.format == "ndjson" else "json") + (".gz" if args.gzip else "")
     path = os.path.abspath(os.path.expanduser(dest))
     if os.path.isfile(path):
         print("[i] File {} already exists".format(path))
@@ -368,106 +466,184 @@ def export(args):
         if ask != "y":
             error_print("Operation aborted")
             return
-    with Storage() as s:
-        full_path = s.export(path)
+    with Storage(readonly=True) as s:
+        full_path = s.export(path, format=args.format, compress=args.gzip)
         s.write_history("export", "exported boards to [{}]".format(full_path))
     print()
     p(color + "[E] Exported boards to", Style.BRIGHT + full_path)
     print()
 
 
-def history(_):
-    hist = History.load()
+def migrate(args):
+    color = get_fore_color("migrate")
+    backend = args.backend
+    if Storage.resident:
+        error_print("Stop `board serve` before migrating")
+        return
+    if backend == BACKEND:
+        error_print("Storage is already using the {} backend".format(backend))
+        return
+    if get_backend(backend).exists():
+        print("[i] Storage of the {} backend already exists".format(backend))
+        ask = input("[?] Overwrite (y/n) ? ")
+        if ask != "y":
+            error_print("Operation aborted")
+            return
+    with Storage(readonly=True) as s:
+        amt = s.migrate(backend)
+    # switch to the new backend
+    config = load_config(CONFIG_PATH)
+    config["StorageBackend"] = backend
+    save_config(CONFIG_PATH, config)
+    print()
+    p(color + "[M] Migrated", Style.DIM + str(amt) + Style.RESET_ALL, color + "items from", Style.BRIGHT + BACKEND, color + "to", Style.BRIGHT + backend)
+    print()
+
+
+def serve(args):
+    from .server import Server
+    color = get_fore_color("serve")
+    server = Server(execute, delay=args.delay)
+    server.start()
+    print()
+    p(color + "[S] Serving the storage on", Style.BRIGHT + SOCKET_PATH)
+    p(Style.DIM + "Press Ctrl+C to stop")
+    print()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    p(color + "[S] Stopped serving")
+    print()
+
+
+def search(args):
+    text = " ".join(args.terms)
+    with Storage(readonly=True) as s:
+        display_results(s.search(text, tag=args.tag, board=args.board), s.boards)
+
+
+def query(args):
+    with Storage(readonly=True) as s:
+        display_results(s.query(args.predicates), s.boards)
+
+
+def history(args):
+    if args.compact:
+        # segments are sealed and removed by other commands while they have the storage
+        with Storage():
+            removed, archived = History.compact(**HISTORY_RETENTION)
+        print()
+        p(Fore.LIGHTYELLOW_EX + "[.] Compacted history:", Style.DIM + str(removed) + Style.RESET_ALL, "entries removed,",
+          Style.DIM + str(archived) + Style.RESET_ALL, "segments archived")
+        print()
+        return
+    if args.last is not None and args.last < 1:
+        error_print("Amount of entries must be positive")
+        return
+    if args.last is None and args.action is None and args.since is None:
+        hist = History.iter_entries()
+    else:
+        hist = History.latest(args.last, action=args.action, since=args.since)
     for action in hist:
         name = action["action"]
         info = action["info"]
         date = action["date"]
-        print(Fore.LIGHTYELLOW_EX + date, get_back_color(name) + Fore.BLACK + name.upper().center(9), info)
+        print(Style.DIM + str(action["id"]).rjust(5) + Style.RESET_ALL, Fore.LIGHTYELLOW_EX + date, get_back_color(name) + Fore.BLACK + name.upper().center(9), info)
 
 
-def display_board(shelf, date=False, timeline=False):
-    # print initial help message
-    if not shelf:
-        print()
-        c = "`board --help`"
-        p(Style.BRIGHT + "Type", Style.BRIGHT + Fore.YELLOW + c, Style.BRIGHT + "to get started")
+def date_arg(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date '{}', expected YYYY-MM-DD".format(value))
+
+
+def display_board(groups, date=False, timeline=False, boards=None, footer=(0, 0, 0), total=0):
+    with phase("display"):
+        renderer = Renderer()
+        if total == 0:
+            renderer.help()
+        renderer.boards(groups, date=date, timeline=timeline, boards=boards)
+        renderer.print()
+        renderer.footer(*footer)
+        renderer.total(total)
+        renderer.print()
+        renderer.flush()
+
+
+def upcoming(args):
+    if args.days < 0:
+        error_print("Days must not be negative")
+        return
+    with Storage(readonly=True) as s:
+        # from today until the end of the last day
+        display_due(s.due_items(to_timestamp(add_date(0)), to_timestamp(add_date(args.days + 1))))
+
+
+def overdue(_):
+    with Storage(readonly=True) as s:
+        display_due(s.due_items(stop=to_timestamp(add_date(0))))
+
+
+def display_due(results):
+    # group the results by due date, which they are sorted by
+    with phase("display"):
+        groups = []
+        for _, item in results:
+            date = to_datetime(item.due).strftime("%a %d %b %Y")
+            if not groups or groups[-1][0] != date:
+                groups.append((date, []))
+            groups[-1][1].append(item)
+        renderer = Renderer()
+        renderer.boards(((date, len(items), items) for date, items in groups), timeline=True, boards={item.id: board for board, item in results})
+        renderer.print()
+        renderer.p(Fore.LIGHTCYAN_EX + "Found Items:", Style.DIM + str(len(results)))
+        renderer.print()
+        renderer.flush()
+
+
+def display_results(results, boards):
+    # group the results by board, in the order of the boards
+    with phase("display"):
+        data = {}
+        for board, item in results:
+            data.setdefault(board, []).append(item)
+        renderer = Renderer()
+        renderer.boards((board, len(data[board]), data[board]) for board in boards if board in data)
+        renderer.print()
+        renderer.p(Fore.LIGHTCYAN_EX + "Found Items:", Style.DIM + str(len(results)))
+        renderer.print()
+        renderer.flush()
+
+
+def find_command(argv):
+    """Get the name of the command in the arguments, or None if there is none or it is unknown."""
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg.startswith("-"):
+            # skip the value of an option (which may be abbreviated)
+            skip = "=" not in arg and len(arg) > 2 and any(option.startswith(arg) for option in VALUE_OPTIONS)
+        else:
+            return arg if arg in COMMANDS else None
+    return None
 
-    for board in shelf:
-        # Print Board title
-        if len(shelf[board]) == 0:
-            continue
-        print()
-        p("\033[4m" + Style.BRIGHT + board, Fore.LIGHTBLACK_EX + "[{}]".format(len(shelf[board])))
-
-        # Print Item
-        for item in shelf[board]:
-            mark = Fore.BLUE + "●"
-            text_color = ""
-            tag_text = ""
-
-            # tick
-            if item["tick"] is True:
-                mark = Fore.GREEN + "✔"
-                text_color = Fore.LIGHTBLACK_EX
-
-            # mark
-            if item["mark"] is True:
-                if item["tick"] is False:
-                    mark = Fore.LIGHTRED_EX + "!"
-                text_color = Style.BRIGHT + Fore.RED
-
-            # tag
-            if item["tag"]:
-                c = TAGS.get(item["tag"], "") or TAGS["default"]
-                tag_color = eval("Fore." + c.upper())
-                tag_text = " " + tag_color + "(" + item["tag"] + ")"
-
-            # Star
-            star = " "
-            if item["star"] is True:
-                star = Fore.LIGHTYELLOW_EX + "⭑"
-
-            # Day difference
-            days = time_diff(item["time"]).days
-            if days <= 0:
-                day_text = ""
-            else:
-                day_text = Fore.LIGHTBLACK_EX + "{}d".format(days)
-
-            # Due date
-            due_text = ""
-            color = ""
-            if item["due"]:
-                due_days = time_diff(item["due"], reverse=True).days + 1  # + 1 because today is included
-                if due_days == 0:
-                    text = "today"
-                    color = Fore.RED
-                elif due_days == 1:
-                    text = "tomorrow"
-                    color = Fore.YELLOW
-                elif due_days == -1:
-                    text = "yesterday"
-                    color = Fore.BLUE
-                elif due_days < 0:
-                    text = "{}d ago".format(due_days*-1)
-                elif due_days > 0:
-                    text = "{}d".format(due_days)
-                due_text = "{}(due: {}{})".format(Fore.LIGHTBLACK_EX, color + text, Style.RESET_ALL + Fore.LIGHTBLACK_EX)
-
-            # print text all together
-            if date is True and timeline is False:
-                p(star, Fore.LIGHTMAGENTA_EX + str(item["id"]).rjust(2), mark, text_color + item["text"], tag_text, Fore.LIGHTBLACK_EX + str(item["date"]),
-                  (Fore.LIGHTBLACK_EX + "(due: {})".format(color + str(to_datetime(item["due"])) + Fore.LIGHTBLACK_EX)) if item["due"] else "")
-            else:
-                p(star, Fore.LIGHTMAGENTA_EX + str(item["id"]).rjust(2), mark, text_color + item["text"] + (Style.RESET_ALL + Fore.LIGHTBLUE_EX + "  @" + item["board"] if timeline else ""),
-                  tag_text, day_text, due_text)
-    print()
-    print_footer()
-    print_total()
-    print()
 
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if find_command(argv) != "serve" and os.path.exists(SOCKET_PATH):
+        # let `board serve` run the command if it is running
+        from .server import forward
+        code = forward(argv)
+        if code is not None:
+            sys.exit(code)
+    execute(argv)
 
-def main():
+
+def execute(argv):
+    begin = time.perf_counter()
     description = (Style.BRIGHT + "    \033[4mNoteboard" + Style.RESET_ALL + " lets you manage your " + Fore.YELLOW + "notes" + Fore.RESET + " & " + Fore.CYAN + "tasks" + Fore.RESET
                    + " in a " + Fore.LIGHTMAGENTA_EX + "tidy" + Fore.RESET + " and " + Fore.LIGHTMAGENTA_EX + "fancy" + Fore.RESET + " way.")
     epilog = (
@@ -479,6 +655,8 @@ def main():
         '  $ board tag 1 6 -t "enhancement" -c GREEN\n'
         '  $ board tick 1 5 9\n'
         '  $ board move 2 3 -b "Destination"\n'
+        '  $ board search cli -t "enhancement"\n'
+        '  $ board query star no-tick board="Todo List"\n'
         '  $ board import ~/Documents/board.json\n'
         '  $ board export ~/Documents/save.json\n\n'
         "{0}crafted with {1}\u2764{2} by tnychn{3} (https://github.com/tnychn/noteboard)".format(Style.BRIGHT, Fore.RED, Fore.RESET, Style.RESET_ALL)
@@ -495,105 +673,241 @@ def main():
     parser.add_argument("-d", "--date", help="show boards with the added date of every item", default=False, action="store_true", dest="d")
     parser.add_argument("-s", "--sort", help="show boards with items on each board sorted alphabetically", default=False, action="store_true", dest="s")
     parser.add_argument("-t", "--timeline", help="show boards in timeline view, ignore the -d/--date option", default=False, action="store_true", dest="t")
+    parser.add_argument("--since", help="show items added on or after this date in timeline view", type=date_arg, metavar="<YYYY-MM-DD>")
+    parser.add_argument("--until", help="show items added on or before this date in timeline view", type=date_arg, metavar="<YYYY-MM-DD>")
+    parser.add_argument("--board", help="show only this board", type=str, metavar="<name>")
+    parser.add_argument("--limit", help="show at most this amount of items", type=int, metavar="<n>")
+    parser.add_argument("--offset", help="skip this amount of items", type=int, default=0, metavar="<n>")
+    parser.add_argument("--page", help="show this page of items, {} items (or --limit) per page".format(PAGE_SIZE), type=int, metavar="<n>")
+    parser.add_argument("--profile", help="print the time of every phase of the command (or set NOTEBOARD_PROFILE=1)", default=False, action="store_true")
+    parser.add_argument("--profile-dump", help="write the cProfile stats of the command to this file, implies --profile (or set NOTEBOARD_PROFILE_DUMP)",
+                        type=str, metavar="<path>")
     subparsers = parser.add_subparsers()
+    # only build the parser of the command to run, or of all commands if it is unknown (e.g. for --help)
+    command = find_command(argv)
+
+    if command in (None, "add"):
+        add_parser = subparsers.add_parser("add", help=get_fore_color("add") + "[+] Add an item to a board" + Fore.RESET)
+        add_parser.add_argument("item", help="the item you want to add", type=str, metavar="<item text>", nargs="*")
+        add_parser.add_argument("-f", "--from-file", help="add an item for every line of a file (or stdin if `-`), either text or JSON of the text, board, tag, due and star",
+                                type=str, metavar="<path>", dest="file")
+        add_parser.add_argument("-b", "--board", help="the board you want to add the item to (default: {})".format(DEFAULT_BOARD), type=str, metavar="<name>")
+        add_parser.set_defaults(func=add)
+
+    if command in (None, "remove"):
+        remove_parser = subparsers.add_parser("remove", help=get_fore_color("remove") + "[-] Remove items" + Fore.RESET)
+        remove_parser.add_argument("item", help="id of the item you want to remove", type=int, metavar="<item id>", nargs="+")
+        remove_parser.set_defaults(func=remove)
+
+    if command in (None, "clear"):
+        clear_parser = subparsers.add_parser("clear", help=get_fore_color("clear") + "[x] Clear all items on a/all board(s)" + Fore.RESET)
+        clear_parser.add_argument("board", help="clear this specific board", type=str, metavar="<name>", nargs="*")
+        clear_parser.set_defaults(func=clear)
+
+    if command in (None, "tick"):
+        tick_parser = subparsers.add_parser("tick", help=get_fore_color("tick") + "[✓] Tick/Untick an item" + Fore.RESET)
+        tick_parser.add_argument("item", help="id of the item you want to tick/untick", type=int, metavar="<item id>", nargs="+")
+        tick_parser.set_defaults(func=tick)
+
+    if command in (None, "mark"):
+        mark_parser = subparsers.add_parser("mark", help=get_fore_color("mark") + "[!] Mark/Unmark an item" + Fore.RESET)
+        mark_parser.add_argument("item", help="id of the item you want to mark/unmark", type=int, metavar="<item id>", nargs="+")
+        mark_parser.set_defaults(func=mark)
+
+    if command in (None, "star"):
+        star_parser = subparsers.add_parser("star", help=get_fore_color("star") + "[*] Star/Unstar an item" + Fore.RESET)
+        star_parser.add_argument("item", help="id of the item you want to star/unstar", type=int, metavar="<item id>", nargs="+")
+        star_parser.set_defaults(func=star)
+
+    if command in (None, "edit"):
+        edit_parser = subparsers.add_parser("edit", help=get_fore_color("edit") + "[~] Edit the text of an item" + Fore.RESET)
+        edit_parser.add_argument("item", help="id of the item you want to edit", type=int, metavar="<item id>")
+        edit_parser.add_argument("text", help="new text to replace the old one", type=str, metavar="<new text>")
+        edit_parser.set_defaults(func=edit)
+
+    if command in (None, "tag"):
+        tag_parser = subparsers.add_parser("tag", help=get_fore_color("tag") + "[#] Tag an item with text" + Fore.RESET)
+        tag_parser.add_argument("item", help="id of the item you want to tag", type=int, metavar="<item id>", nargs="+")
+        tag_parser.add_argument("-t", "--text", help="text of tag (do not specify this argument to untag)", type=str, metavar="<tag text>")
+        tag_parser.set_defaults(func=tag)
+
+    if command in (None, "due"):
+        due_parser = subparsers.add_parser("due", help=get_fore_color("due") + "[:] Assign a due date to an item" + Fore.RESET)
+        due_parser.add_argument("item", help="id of the item", type=int, metavar="<item id>", nargs="+")
+        due_parser.add_argument("-d", "--date", help="due date of the item in the format of `<digit><d|w>` e.g. '1w4d' for 1 week and 4 days (11 days)", type=str, metavar="<due date>")
+        due_parser.set_defaults(func=due)
+
+    if command in (None, "run"):
+        run_parser = subparsers.add_parser("run", help=get_fore_color("run") + "[>] Run an item as command" + Fore.RESET)
+        run_parser.add_argument("item", help="id of the item you want to run", type=int, metavar="<item id>")
+        run_parser.set_defaults(func=run)
+
+    if command in (None, "move"):
+        move_parser = subparsers.add_parser("move", help=get_fore_color("move") + "[&] Move an item to another board" + Fore.RESET)
+        move_parser.add_argument("item", help="id of the item you want to move", type=int, metavar="<item id>", nargs="+")
+        move_parser.add_argument("-b", "--board", help="name of the destination board", type=str, metavar="<name>", required=True)
+        move_parser.set_defaults(func=move)
+
+    if command in (None, "rename"):
+        rename_parser = subparsers.add_parser("rename", help=get_fore_color("rename") + "[~] Rename the name of the board" + Fore.RESET)
+        rename_parser.add_argument("board", help="name of the board you want to rename", type=str, metavar="<name>")
+        rename_parser.add_argument("new", help="new name to replace the old one", type=str, metavar="<new name>")
+        rename_parser.set_defaults(func=rename)
+
+    if command in (None, "undo"):
+        undo_parser = subparsers.add_parser("undo", help=get_fore_color("undo") + "[^] Undo the last action" + Fore.RESET)
+        undo_parser.add_argument("-n", "--steps", help="amount of the latest actions to undo (default: 1)", type=int, default=1, metavar="<n>")
+        undo_parser.add_argument("--to", help="undo the actions back to this history entry, including it", type=int, metavar="<entry id>")
+        undo_parser.set_defaults(func=undo)
+
+    if command in (None, "redo"):
+        redo_parser = subparsers.add_parser("redo", help=get_fore_color("redo") + "[^] Redo the last undone action" + Fore.RESET)
+        redo_parser.add_argument("-n", "--steps", help="amount of the undone actions to redo (default: 1)", type=int, default=1, metavar="<n>")
+        redo_parser.set_defaults(func=redo)
+
+    if command in (None, "import"):
+        import_parser = subparsers.add_parser("import", help=get_fore_color("import") + "[I] Import and load boards from an exported file" + Fore.RESET)
+        import_parser.add_argument("path", help="path to the target import file", type=str, metavar="<path>")
+        import_parser.add_argument("-m", "--merge", help="add the items to the current boards instead of overwriting them", default=False, action="store_true")
+        import_parser.set_defaults(func=import_)
+
+    if command in (None, "export"):
+        from .archive import FORMATS
+        export_parser = subparsers.add_parser("export", help=get_fore_color("export") + "[E] Export boards as a JSON file" + Fore.RESET)
+        export_parser.add_argument("-d", "--dest", help="destination of the exported file (default: ./board.json, ./board.ndjson for ndjson and .gz appended for gzip)",
+                                   type=str, metavar="<destination path>")
+        export_parser.add_argument("-f", "--format", help="pretty: indented JSON (default), compact: JSON without whitespace, ndjson: an item per line",
+                                   type=str, choices=FORMATS, default="pretty")
+        export_parser.add_argument("-z", "--gzip", help="compress the exported file with gzip", default=False, action="store_true")
+        export_parser.set_defaults(func=export)
+
+    if command in (None, "migrate"):
+        migrate_parser = subparsers.add_parser("migrate", help=get_fore_color("migrate") + "[M] Migrate boards to another storage backend" + Fore.RESET)
+        migrate_parser.add_argument("backend", help="name of the destination backend", type=str, choices=list(BACKENDS), metavar="<backend>")
+        migrate_parser.set_defaults(func=migrate)
+
+    if command in (None, "search"):
+        search_parser = subparsers.add_parser("search", help="[?] Search items by words in their text and tag")
+        search_parser.add_argument("terms", help="words which the items must all contain", type=str, metavar="<term>", nargs="+")
+        search_parser.add_argument("-t", "--tag", help="only search items with this tag", type=str, metavar="<tag text>")
+        search_parser.add_argument("-b", "--board", help="only search items on this board", type=str, metavar="<name>")
+        search_parser.set_defaults(func=search)
+
+    if command in (None, "query"):
+        query_parser = subparsers.add_parser("query", help="[?] Query items by their flags, tags and boards")
+        query_parser.add_argument("predicates", help="tick, mark, star, due, tag, tag=<text> or board=<name>, prefixed with `no-` to negate, "
+                                  "all of which must match unless separated by `or`", type=str, metavar="<predicate>", nargs="+")
+        query_parser.set_defaults(func=query)
+
+    if command in (None, "upcoming"):
+        upcoming_parser = subparsers.add_parser("upcoming", help=get_fore_color("due") + "[:] Show items due in the next days" + Fore.RESET)
+        upcoming_parser.add_argument("-d", "--days", help="show items due within this amount of days from today (default: 7)", type=int, default=7, metavar="<days>")
+        upcoming_parser.set_defaults(func=upcoming)
+
+    if command in (None, "overdue"):
+        overdue_parser = subparsers.add_parser("overdue", help=get_fore_color("due") + "[:] Show items past their due date" + Fore.RESET)
+        overdue_parser.set_defaults(func=overdue)
+
+    if command in (None, "history"):
+        history_parser = subparsers.add_parser("history", help="[.] Prints out the historical changes")
+        history_parser.add_argument("-n", "--last", help="show only this amount of the latest entries", type=int, metavar="<n>")
+        history_parser.add_argument("-a", "--action", help="show only entries of this action, e.g. tick", type=str, metavar="<action>")
+        history_parser.add_argument("--since", help="show only entries of this date or later", type=date_arg, metavar="<YYYY-MM-DD>")
+        history_parser.add_argument("--compact", help="remove the oldest history beyond the limits of the config and gzip the rest", default=False, action="store_true")
+        history_parser.set_defaults(func=history)
+
+    if command in (None, "serve"):
+        serve_parser = subparsers.add_parser("serve", help=get_fore_color("serve") + "[S] Serve the storage from memory to speed up other commands" + Fore.RESET)
+        serve_parser.add_argument("-d", "--delay", help="persist the changes after this amount of seconds without any commands (default: 1)",
+                                  type=float, default=1.0, metavar="<seconds>")
+        serve_parser.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    init(autoreset=True)
+    dump = args.profile_dump or os.environ.get("NOTEBOARD_PROFILE_DUMP")
+    if args.profile or dump or os.environ.get("NOTEBOARD_PROFILE"):
+        dispatch_profiled(args, begin, dump)
+    else:
+        dispatch(args)
+    deinit()
 
-    add_parser = subparsers.add_parser("add", help=get_fore_color("add") + "[+] Add an item to a board" + Fore.RESET)
-    add_parser.add_argument("item", help="the item you want to add", type=str, metavar="<item text>", nargs="+")
-    add_parser.add_argument("-b", "--board", help="the board you want to add the item to (default: {})".format(DEFAULT_BOARD), type=str, metavar="<name>")
-    add_parser.set_defaults(func=add)
-
-    remove_parser = subparsers.add_parser("remove", help=get_fore_color("remove") + "[-] Remove items" + Fore.RESET)
-    remove_parser.add_argument("item", help="id of the item you want to remove", type=int, metavar="<item id>", nargs="+")
-    remove_parser.set_defaults(func=remove)
-
-    clear_parser = subparsers.add_parser("clear", help=get_fore_color("clear") + "[x] Clear all items on a/all board(s)" + Fore.RESET)
-    clear_parser.add_argument("board", help="clear this specific board", type=str, metavar="<name>", nargs="*")
-    clear_parser.set_defaults(func=clear)
-
-    tick_parser = subparsers.add_parser("tick", help=get_fore_color("tick") + "[✓] Tick/Untick an item" + Fore.RESET)
-    tick_parser.add_argument("item", help="id of the item you want to tick/untick", type=int, metavar="<item id>", nargs="+")
-    tick_parser.set_defaults(func=tick)
-
-    mark_parser = subparsers.add_parser("mark", help=get_fore_color("mark") + "[!] Mark/Unmark an item" + Fore.RESET)
-    mark_parser.add_argument("item", help="id of the item you want to mark/unmark", type=int, metavar="<item id>", nargs="+")
-    mark_parser.set_defaults(func=mark)
-
-    star_parser = subparsers.add_parser("star", help=get_fore_color("star") + "[*] Star/Unstar an item" + Fore.RESET)
-    star_parser.add_argument("item", help="id of the item you want to star/unstar", type=int, metavar="<item id>", nargs="+")
-    star_parser.set_defaults(func=star)
-
-    edit_parser = subparsers.add_parser("edit", help=get_fore_color("edit") + "[~] Edit the text of an item" + Fore.RESET)
-    edit_parser.add_argument("item", help="id of the item you want to edit", type=int, metavar="<item id>")
-    edit_parser.add_argument("text", help="new text to replace the old one", type=str, metavar="<new text>")
-    edit_parser.set_defaults(func=edit)
-
-    tag_parser = subparsers.add_parser("tag", help=get_fore_color("tag") + "[#] Tag an item with text" + Fore.RESET)
-    tag_parser.add_argument("item", help="id of the item you want to tag", type=int, metavar="<item id>", nargs="+")
-    tag_parser.add_argument("-t", "--text", help="text of tag (do not specify this argument to untag)", type=str, metavar="<tag text>")
-    tag_parser.set_defaults(func=tag)
-
-    due_parser = subparsers.add_parser("due", help=get_fore_color("due") + "[:] Assign a due date to an item" + Fore.RESET)
-    due_parser.add_argument("item", help="id of the item", type=int, metavar="<item id>", nargs="+")
-    due_parser.add_argument("-d", "--date", help="due date of the item in the format of `<digit><d|w>` e.g. '1w4d' for 1 week and 4 days (11 days)", type=str, metavar="<due date>")
-    due_parser.set_defaults(func=due)
-
-    run_parser = subparsers.add_parser("run", help=get_fore_color("run") + "[>] Run an item as command" + Fore.RESET)
-    run_parser.add_argument("item", help="id of the item you want to run", type=int, metavar="<item id>")
-    run_parser.set_defaults(func=run)
-
-    move_parser = subparsers.add_parser("move", help=get_fore_color("move") + "[&] Move an item to another board" + Fore.RESET)
-    move_parser.add_argument("item", help="id of the item you want to move", type=int, metavar="<item id>", nargs="+")
-    move_parser.add_argument("-b", "--board", help="name of the destination board", type=str, metavar="<name>", required=True)
-    move_parser.set_defaults(func=move)
-
-    rename_parser = subparsers.add_parser("rename", help=get_fore_color("rename") + "[~] Rename the name of the board" + Fore.RESET)
-    rename_parser.add_argument("board", help="name of the board you want to rename", type=str, metavar="<name>")
-    rename_parser.add_argument("new", help="new name to replace the old one", type=str, metavar="<new name>")
-    rename_parser.set_defaults(func=rename)
-
-    undo_parser = subparsers.add_parser("undo", help=get_fore_color("undo") + "[^] Undo the last action" + Fore.RESET)
-    undo_parser.set_defaults(func=undo)
-
-    import_parser = subparsers.add_parser("import", help=get_fore_color("import") + "[I] Import and load boards from JSON file" + Fore.RESET)
-    import_parser.add_argument("path", help="path to the target import file", type=str, metavar="<path>")
-    import_parser.set_defaults(func=import_)
 
-    export_parser = subparsers.add_parser("export", help=get_fore_color("export") + "[E] Export boards as a JSON file" + Fore.RESET)
-    export_parser.add_argument("-d", "--dest", help="destination of the exported file (default: ./board.json)", type=str, default="./board.json", metavar="<destination path>")
-    export_parser.set_defaults(func=export)
+def dispatch_profiled(args, begin, dump=None):
+    from . import profiling
+    profiling.start(begin)
+    profiler = None
+    if dump:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with profiling.phase("command"):
+            dispatch(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(dump)
+        lines = profiling.stop()
+        # keep the output of the command clean, e.g. when it is piped
+        print(file=sys.stderr)
+        print(Fore.LIGHTYELLOW_EX + "  " + lines[0], file=sys.stderr)
+        for line in lines[1:]:
+            print("  " + line, file=sys.stderr)
+        if profiler is not None:
+            print("  " + Style.DIM + "cProfile stats written to {}".format(os.path.abspath(dump)), file=sys.stderr)
+        print(file=sys.stderr)
+
+
+def show_boards(args, timeline, offset, limit):
+    with Storage(readonly=True) as s:
+        if args.board is not None and args.board not in s.boards:
+            error_print(str(BoardNotFoundError(args.board)))
+            return
+        key, reverse = None, False
+        if args.s:
+            # sort alphabetically
+            key = lambda x: x.text.lower()
+        elif args.d:
+            # sort by date
+            key, reverse = lambda x: x.time, True
+
+        boards = {}
+        if timeline:
+            groups = []
+            for day, results in s.iter_timeline(args.since, args.until, args.board, offset=offset, limit=limit):
+                items = [item for _, item in results]
+                boards.update((item.id, board) for board, item in results)
+                if args.s:
+                    items.sort(key=key)
+                groups.append((day.strftime("%a %d %b %Y"), len(items), items))
+        else:
+            groups = s.iter_boards(args.board, offset=offset, limit=limit, key=key, reverse=reverse)
+        display_board(groups, date=args.d, timeline=timeline, boards=boards, footer=s.count_flags(), total=s.total)
 
-    history_parser = subparsers.add_parser("history", help="[.] Prints out the historical changes")
-    history_parser.set_defaults(func=history)
 
-    args = parser.parse_args()
-    init(autoreset=True)
+def dispatch(args):
     try:
         args.func
     except AttributeError:
-        with Storage() as s:
-            shelf = dict(s.shelf)
+        limit = args.limit
+        offset = args.offset
+        if args.page is not None:
+            limit = limit or PAGE_SIZE
+            offset = (args.page - 1) * limit
+        if (limit is not None and limit < 1) or offset < 0 or (args.page is not None and args.page < 1):
+            error_print("Limit and page must be positive and offset must not be negative")
+            return
 
-        if args.s:
-            # sort alphabetically
-            for board in shelf:
-                shelf[board] = sorted(shelf[board], key=lambda x: x["text"].lower())
-        elif args.d:
-            # sort by date
-            for board in shelf:
-                shelf[board] = sorted(shelf[board], key=lambda x: x["time"], reverse=True)
-
-        if args.t:
-            data = {}
-            for board in shelf:
-                for item in shelf[board]:
-                    if item["date"]:
-                        if item["date"] not in data:
-                            data[item["date"]] = []
-                        item.update({"board": board})
-                        data[item["date"]].append(item)
-            shelf = data
-        display_board(shelf, date=args.d, timeline=args.t)
+        # a range of dates implies the timeline view
+        timeline = args.t or args.since is not None or args.until is not None
+        try:
+            show_boards(args, timeline, offset, limit)
+        except NoteboardException as e:
+            # e.g. the storage is locked
+            error_print(str(e))
+            logger.debug("(ERROR)", exc_info=True)
     else:
+        prepare()
         try:
             args.func(args)
         except KeyboardInterrupt:
@@ -604,7 +918,6 @@ def main():
         except Exception as e:
             error_print(str(e))
             logger.debug("(ERROR)", exc_info=True)
-    deinit()
 
 
 if __name__ == "__main__":
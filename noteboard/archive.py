@@ -0,0 +1,183 @@
+import re
+import json
+import gzip
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Formats of archive files
+#   pretty -- a JSON object of board names and lists of items, indented and with sorted keys
+#   compact -- the same JSON object without any whitespace
+#   ndjson -- a JSON object of an item and the name of its board ("board") per line
+FORMATS = ("pretty", "compact", "ndjson")
+
+
+class JSONStream:
+    """Parse a JSON document from a file incrementally, keeping only a chunk of it in memory."""
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.mark = None  # position to keep in the buffer for looking ahead
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # read the next chunk, dropping the part of the buffer which has been parsed
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        keep = self.pos if self.mark is None else self.mark
+        self.buffer = self.buffer[keep:] + data
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark = 0
+        return True
+
+    def peek(self):
+        """Get the next character which is not whitespace, or an empty string at the end of the file."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of `chars`, and return it."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Expected one of '{}' but got '{}'".format(chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Parse the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value may continue in the next chunk
+                if self._fill():
+                    continue
+                raise
+            if end == len(self.buffer) and self._fill():
+                # a number may continue in the next chunk as well
+                continue
+            self.pos = end
+            return value
+
+    def end(self):
+        if self.peek():
+            raise ValueError("Extra data after the end of the document")
+
+
+def open_archive(path, mode="r", compress=None):
+    """Open an archive file as text, which is gzipped if `compress` is True.
+    In read mode, gzipped files are detected by their magic number instead."""
+    if "r" in mode:
+        with open(path, "rb") as f:
+            compress = f.read(2) == GZIP_MAGIC
+    if compress:
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+def iter_archive(f):
+    """Iterate over the boards and items of an archive file of any format.
+
+    Yields:
+        str -- name of the board
+        object -- an item, which is not validated
+    """
+    stream = JSONStream(f)
+    if stream.peek() == "{":
+        # look ahead whether the first value of the object is a list of items (or there is none)
+        stream.mark = stream.pos
+        stream.expect("{")
+        is_object = stream.peek() == "}" or (isinstance(stream.value(), str) and stream.expect(":") and stream.peek() == "[")
+        stream.pos, stream.mark = stream.mark, None
+        if not is_object:
+            return _iter_lines(stream)
+    return _iter_object(stream)
+
+
+def _iter_object(stream):
+    stream.expect("{")
+    if stream.peek() == "}":
+        stream.expect("}")
+    else:
+        while True:
+            board = stream.value()
+            if not isinstance(board, str):
+                raise ValueError("Board title must be a string")
+            stream.expect(":")
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.expect("]")
+            else:
+                while True:
+                    yield board, stream.value()
+                    if stream.expect(",]") == "]":
+                        break
+            if stream.expect(",}") == "}":
+                break
+    stream.end()
+
+
+def _iter_lines(stream):
+    while stream.peek():
+        item = stream.value()
+        board = item.pop("board", None) if isinstance(item, dict) else None
+        if not isinstance(board, str):
+            raise ValueError("Board title must be a string")
+        yield board, item
+
+
+def write_archive(f, boards, format="pretty"):
+    """Write boards to an archive file, one item at a time.
+
+    Arguments:
+        f {file} -- the archive file opened as text
+        boards {iterable} -- tuples of board name and an iterable of item dictionaries,
+                             which should be sorted by board name for the pretty format
+        format {str} -- one of `FORMATS`
+    """
+    if format == "ndjson":
+        encode = json.JSONEncoder(separators=(",", ":")).encode
+        for board, items in boards:
+            for item in items:
+                line = {"board": board}
+                line.update(item)
+                f.write(encode(line) + "\n")
+        return
+    if format == "pretty":
+        # the same output as `json.dump(data, f, indent=4, sort_keys=True)`
+        encode = json.JSONEncoder(indent=4, sort_keys=True).encode
+        start, sep, end = "{\n    ", ",\n    ", "\n}"
+        open_list, item_sep, close_list, empty_list = ": [\n        ", ",\n        ", "\n    ]", ": []"
+        indent = "\n        "
+    elif format == "compact":
+        encode = json.JSONEncoder(separators=(",", ":")).encode
+        start, sep, end = "{", ",", "}"
+        open_list, item_sep, close_list, empty_list = ":[", ",", "]", ":[]"
+        indent = None
+    else:
+        raise ValueError("Unknown format '{}' (available: {})".format(format, ", ".join(FORMATS)))
+    first = True
+    for board, items in boards:
+        f.write((start if first else sep) + encode(board))
+        first_item = True
+        for item in items:
+            text = encode(item)
+            if indent is not None:
+                text = text.replace("\n", indent)
+            f.write((open_list if first_item else item_sep) + text)
+            first_item = False
+        f.write(empty_list if first_item else close_list)
+        first = False
+    f.write("{}" if first else end)
@@ -0,0 +1,637 @@
+import bisect
+import os
+import logging
+from collections import Counter
+
+from . import STORAGE_PATH, STORAGE_GZ_PATH, STORAGE_DB_PATH
+from .item import Item, SCHEMA_VERSION
+from .utils import sync_dir
+
+logger = logging.getLogger("noteboard")
+
+# Keys of the shelf starting with this prefix hold metadata instead of boards
+META_PREFIX = "\x00"
+INDEX_KEY = META_PREFIX + "index"
+POSTINGS_PREFIX = META_PREFIX + "postings:"
+
+
+class Backend:
+    """Interface of the storage engines behind `Storage`.
+
+    Items are passed in and out as `Item` objects. Boards come into existence
+    with their first item and backends drop boards left empty when closed.
+    """
+
+    name = None
+    # Whether `Storage` logs the changes to a write-ahead log and only persists the backend at checkpoints.
+    # Such backends must accept changes while opened read-only, which are never written to the disk.
+    journaled = False
+
+    def open(self, readonly=False):
+        """Open the store. Nothing is written back to the disk if `readonly` is True."""
+        raise NotImplementedError
+
+    def close(self, persist=True):
+        """Close the store, persisting the changes if there are any, unless `persist` is False."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist the changes to the disk without closing the store."""
+        raise NotImplementedError
+
+    def boards(self):
+        """Get the names of all boards, in the order they were created."""
+        raise NotImplementedError
+
+    def count(self):
+        """Get the total amount of items in all boards."""
+        raise NotImplementedError
+
+    def get_board(self, board):
+        """Get the items of a board sorted by id, or None if the board does not exist."""
+        raise NotImplementedError
+
+    def board_size(self, board):
+        """Get the amount of items in a board without loading them."""
+        raise NotImplementedError
+
+    def iter_board(self, board, offset=0, limit=None):
+        """Iterate over a slice of the items of a board sorted by id."""
+        raise NotImplementedError
+
+    def count_flags(self):
+        """Get a tuple of the amounts of ticked, marked and starred items."""
+        raise NotImplementedError
+
+    def get_item(self, id):
+        """Get a tuple of the board name and the item with the given id, or None if not found."""
+        raise NotImplementedError
+
+    def insert_item(self, board, item):
+        """Insert an item to a board, creating the board if it does not exist."""
+        raise NotImplementedError
+
+    def update_item(self, board, item):
+        """Write back an item which has been modified in place."""
+        raise NotImplementedError
+
+    def delete_item(self, id):
+        """Delete the item with the given id and return a tuple of the board name and the item."""
+        raise NotImplementedError
+
+    def move_item(self, id, board):
+        """Move the item with the given id to a board and return the name of its original board."""
+        raise NotImplementedError
+
+    def index_add(self, name, key, id):
+        """Add an item id to the ids of a key in a secondary index."""
+        raise NotImplementedError
+
+    def index_discard(self, name, key, id):
+        """Remove an item id from the ids of a key in a secondary index, if it is there."""
+        raise NotImplementedError
+
+    def index_get(self, name, key):
+        """Get the set of item ids of a key in a secondary index. The set must not be modified."""
+        raise NotImplementedError
+
+    def index_range(self, name, start=None, stop=None):
+        """Iterate over tuples of key and item id of a secondary index in the order of the keys,
+        from `start` (inclusive) to `stop` (exclusive)."""
+        raise NotImplementedError
+
+    def index_clear(self, name):
+        """Remove all keys of a secondary index."""
+        raise NotImplementedError
+
+    def get_meta(self, key, default=None):
+        raise NotImplementedError
+
+    def set_meta(self, key, value):
+        raise NotImplementedError
+
+    def exists(self):
+        """Check whether the store of this backend exists on disk."""
+        raise NotImplementedError
+
+
+def _insort(items, item):
+    # insert `item` while keeping the items of a board sorted by id
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if items[mid].id > item.id:
+            hi = mid
+        else:
+            lo = mid + 1
+    items.insert(lo, item)
+    return lo
+
+
+def _search(items, id):
+    # get the position of the item with `id` on a board sorted by id, or None
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if items[mid].id < id:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo if lo < len(items) and items[lo].id == id else None
+
+
+class ShelveBackend(Backend):
+    """Every board is stored as a pickled list of item records in a `shelve` database.
+
+    The database files are archived to `storage.gz` when the backend is closed
+    and extracted again when it is opened.
+    """
+
+    name = "shelve"
+    journaled = True
+    # suffixes of the files the different `dbm` implementations create
+    suffixes = ("", ".db", ".dat", ".dir", ".bak", ".pag")
+
+    def __init__(self, path=STORAGE_PATH, gz_path=STORAGE_GZ_PATH):
+        self.path = path
+        self.gz_path = gz_path
+        self.readonly = False
+        self._work = None       # path of the database being accessed
+        self._shelf = None
+        self._boards = {}       # boards loaded from the shelf
+        self._names = []
+        self._dirty = set()     # boards to be written back to the shelf
+        self._modified = False
+        self._index = None      # item id -> (board, position)
+        self._sizes = {}        # board -> amount of items
+        self._stale = {}        # board -> first position from which the positions in the index may be out of date
+        self._indexes = {}      # secondary indexes loaded from the shelf, name -> key -> item ids
+        self._keys = {}         # name -> sorted keys of the secondary index
+        self._dirty_indexes = set()
+
+    def _files(self, path=None):
+        path = path or self.path
+        return [path + suffix for suffix in self.suffixes if os.path.isfile(path + suffix)]
+
+    def exists(self):
+        return os.path.isfile(self.gz_path) or bool(self._files())
+
+    def open(self, readonly=False):
+        # modules of the backends are imported when they are used, to keep the startup of the CLI fast
+        import shelve
+        self.readonly = readonly
+        self._modified = False
+        self._work = self.path
+        if readonly:
+            if os.path.isfile(self.gz_path):
+                # extract to a temporary directory, leaving the storage untouched
+                import tempfile
+                self._work = os.path.join(tempfile.mkdtemp(prefix="noteboard-"), os.path.basename(self.path))
+                self._extract(self._work)
+            elif not self._files():
+                self._work = None
+        elif os.path.isfile(self.gz_path):
+            # files left behind by an interrupted session are older than storage.gz
+            for file in self._files():
+                os.remove(file)
+            self._extract(self._work)
+
+        if self._work is None:
+            self._shelf = {}  # nothing has been stored yet
+        else:
+            self._shelf = shelve.open(self._work, "r" if readonly else "c")
+        self._names = [key for key in self._shelf.keys() if not key.startswith(META_PREFIX)]
+        # boards stored in an older schema are upgraded once anything is written
+        self._upgrade = self._shelf.get(META_PREFIX + "schema", 1) < SCHEMA_VERSION and bool(self._names)
+        self._load_index()
+
+    def close(self, persist=True):
+        if self.readonly:
+            if self._work is not None:
+                self._shelf.close()
+                if self._work != self.path:
+                    import shutil
+                    shutil.rmtree(os.path.dirname(self._work))
+        elif (self._modified and persist) or not os.path.isfile(self.gz_path):
+            self._write()
+            self._shelf.close()
+            self._archive()
+        else:
+            # nothing changed (or the changes are discarded), storage.gz is still up to date
+            self._shelf.close()
+            for file in self._files():
+                os.remove(file)
+        self._shelf = None
+        self._boards.clear()
+        self._stale.clear()
+        self._dirty.clear()
+        self._indexes.clear()
+        self._keys.clear()
+        self._dirty_indexes.clear()
+
+    def flush(self):
+        if self.readonly or not (self._modified or not os.path.isfile(self.gz_path)):
+            return
+        self._write()
+        if hasattr(self._shelf, "sync"):
+            self._shelf.sync()
+        self._archive(remove=False)
+        self._modified = False
+
+    def _write(self):
+        # write the changed boards and the index back to the shelf
+        if self._upgrade:
+            self._dirty.update(self._names)
+            self._upgrade = False
+        for board, start in self._stale.items():
+            self._reindex_board(board, start)
+        self._stale.clear()
+        for board in self._dirty:
+            items = self._load(board)
+            if items:
+                self._shelf[board] = [item.to_record() for item in items]
+            elif board in self._shelf:
+                # remove empty boards
+                del self._shelf[board]
+        for name in self._dirty_indexes:
+            self._shelf[POSTINGS_PREFIX + name] = self._indexes[name]
+        self._dirty.clear()
+        self._dirty_indexes.clear()
+        self._names = self.boards()
+        self._shelf[META_PREFIX + "schema"] = SCHEMA_VERSION
+        self._shelf[INDEX_KEY] = {"ids": self._index, "sizes": self._sizes, "boards": sorted(self._names)}
+
+    def _extract(self, path):
+        import tarfile
+        try:
+            with tarfile.open(self.gz_path, "r:gz") as tar:
+                for member in tar.getmembers():
+                    if os.path.basename(member.name) != member.name:
+                        raise tarfile.ReadError("Unexpected member {}".format(member.name))
+                    tar.extract(member, os.path.dirname(path))
+        except tarfile.ReadError:
+            # storage.gz of older versions contains a single gzipped database file
+            import gzip
+            import shutil
+            with gzip.open(self.gz_path, "rb") as f_in:
+                with open(path, "wb") as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+
+    def _archive(self, remove=True):
+        import tarfile
+        files = self._files()
+        # replace storage.gz atomically, so that it is never left half written
+        tmp = self.gz_path + ".tmp"
+        with open(tmp, "wb") as f:
+            # the default level 9 compresses a large board several times slower than level 6, for hardly a smaller file
+            with tarfile.open(fileobj=f, mode="w:gz", compresslevel=6) as tar:
+                for file in files:
+                    tar.add(file, arcname=os.path.basename(file))
+            # the write-ahead log is emptied after this, so storage.gz must be on the disk first
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.gz_path)
+        sync_dir(os.path.dirname(self.gz_path))
+        if remove:
+            for file in files:
+                os.remove(file)
+
+    def _load(self, board):
+        # get a board from the cache, loading it from the shelf on first access
+        if board not in self._boards:
+            self._boards[board] = [Item.load(record) for record in self._shelf.get(board, [])]
+        return self._boards[board]
+
+    def _build_index(self):
+        """Rebuild the id index by scanning every item on every board."""
+        self._index = {}
+        self._sizes = {}
+        self._stale.clear()
+        self._modified = True
+        for board in self._names:
+            self._reindex_board(board)
+        logger.debug("Built index of {} items".format(len(self._index)))
+
+    def _reindex_board(self, board, start=0):
+        # refresh the positions of items on `board` from position `start` onwards
+        items = self._load(board)
+        for pos in range(start, len(items)):
+            self._index[items[pos].id] = (board, pos)
+        self._sizes[board] = len(items)
+
+    def _load_index(self):
+        index = self._shelf.get(INDEX_KEY)
+        # the stored index is stale if boards were added or removed behind its back
+        if not index or index.get("boards") != sorted(self._names):
+            logger.debug("Index is missing or stale, rebuilding")
+            self._build_index()
+        else:
+            self._index = index["ids"]
+            self._sizes = index.get("sizes") or dict(Counter(board for board, _ in self._index.values()))
+
+    def _locate(self, id):
+        """Get the board name and position of the item with the given id through the index."""
+        if id not in self._index:
+            return None
+        board, pos = self._index[id]
+        items = self._load(board)
+        if pos < len(items) and items[pos].id == id:
+            return board, pos
+        # the item has been shifted by changes before it on the board, which do not update the positions after them
+        pos = _search(items, id)
+        if pos is not None:
+            self._index[id] = (board, pos)
+        else:
+            # the index is out of sync with the shelf, rebuild it and try again
+            logger.debug("Index entry of item {} is stale, rebuilding".format(id))
+            self._build_index()
+            if id not in self._index:
+                return None
+            board, pos = self._index[id]
+        return board, pos
+
+    def boards(self):
+        return [board for board in self._names if self._sizes.get(board)]
+
+    def count(self):
+        return len(self._index)
+
+    def get_board(self, board):
+        if not self._sizes.get(board):
+            return None
+        return list(self._load(board))
+
+    def board_size(self, board):
+        return self._sizes.get(board, 0)
+
+    def iter_board(self, board, offset=0, limit=None):
+        if not self._sizes.get(board):
+            return iter(())
+        # a board is pickled as a whole, so it can only be sliced after being loaded
+        return iter(self._load(board)[offset:None if limit is None else offset + limit])
+
+    def count_flags(self):
+        ticks = marks = stars = 0
+        for board in self.boards():
+            for item in self._load(board):
+                ticks += item.tick
+                marks += item.mark
+                stars += item.star
+        return ticks, marks, stars
+
+    def get_item(self, id):
+        location = self._locate(id)
+        if location is None:
+            return None
+        board, pos = location
+        return board, self._load(board)[pos]
+
+    def insert_item(self, board, item):
+        if board.startswith(META_PREFIX):
+            raise ValueError("Board title must not start with a null character.")
+        if board not in self._names:
+            self._names.append(board)
+        items = self._load(board)
+        pos = _insort(items, item)
+        self._index[item.id] = (board, pos)
+        self._sizes[board] = len(items)
+        self._shift(board, pos + 1)
+        self._dirty.add(board)
+        self._modified = True
+
+    def update_item(self, board, item):
+        self._dirty.add(board)
+        self._modified = True
+
+    def delete_item(self, id):
+        board, pos = self._locate(id)
+        items = self._load(board)
+        item = items.pop(pos)
+        del self._index[id]
+        self._sizes[board] = len(items)
+        self._shift(board, pos)
+        self._dirty.add(board)
+        self._modified = True
+        return board, item
+
+    def move_item(self, id, board):
+        b, _ = self._locate(id)
+        if b != board:
+            _, item = self.delete_item(id)
+            self.insert_item(board, item)
+        return b
+
+    def _shift(self, board, start):
+        # the items from `start` onwards have moved, which `_locate` finds by their ids until the index is written
+        # (updating their positions here would make clearing or moving a whole board quadratic)
+        self._stale[board] = min(self._stale.get(board, start), start)
+
+    def _postings(self, name):
+        # get a secondary index, loading it from the shelf on first access
+        if name not in self._indexes:
+            postings = self._shelf.get(POSTINGS_PREFIX + name) or {}
+            self._indexes[name] = postings
+            self._keys[name] = sorted(postings)
+        return self._indexes[name]
+
+    def index_add(self, name, key, id):
+        postings = self._postings(name)
+        if key not in postings:
+            postings[key] = set()
+            bisect.insort(self._keys[name], key)
+        postings[key].add(id)
+        self._dirty_indexes.add(name)
+        self._modified = True
+
+    def index_discard(self, name, key, id):
+        postings = self._postings(name)
+        ids = postings.get(key)
+        if ids is None or id not in ids:
+            return
+        ids.remove(id)
+        if not ids:
+            del postings[key]
+            keys = self._keys[name]
+            del keys[bisect.bisect_left(keys, key)]
+        self._dirty_indexes.add(name)
+        self._modified = True
+
+    def index_get(self, name, key):
+        return self._postings(name).get(key, set())
+
+    def index_range(self, name, start=None, stop=None):
+        postings = self._postings(name)
+        keys = self._keys[name]
+        lo = 0 if start is None else bisect.bisect_left(keys, start)
+        hi = len(keys) if stop is None else bisect.bisect_left(keys, stop)
+        for key in keys[lo:hi]:
+            for id in sorted(postings[key]):
+                yield key, id
+
+    def index_clear(self, name):
+        self._indexes[name] = {}
+        self._keys[name] = []
+        self._dirty_indexes.add(name)
+        self._modified = True
+
+    def get_meta(self, key, default=None):
+        return self._shelf.get(META_PREFIX + key, default)
+
+    def set_meta(self, key, value):
+        self._shelf[META_PREFIX + key] = value
+        self._modified = True
+
+
+class SQLiteBackend(Backend):
+    """Every item is stored as a row of a `sqlite3` database, which is accessed in place."""
+
+    name = "sqlite"
+    columns = ("id", "text", "time", "due", "tick", "mark", "star", "tag")
+
+    def __init__(self, path=STORAGE_DB_PATH):
+        self.path = path
+        self.readonly = False
+        self._conn = None
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def open(self, readonly=False):
+        import sqlite3
+        self.readonly = readonly
+        if readonly and os.path.isfile(self.path):
+            from urllib.parse import quote
+            self._conn = sqlite3.connect("file:{}?mode=ro".format(quote(self.path)), uri=True)
+            return
+        # a read-only storage which does not exist yet is empty
+        self._conn = sqlite3.connect(":memory:" if readonly else self.path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS boards (name TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY, board TEXT NOT NULL, text TEXT NOT NULL, time REAL,
+                due INTEGER, tick INTEGER, mark INTEGER, star INTEGER, tag TEXT
+            );
+            CREATE INDEX IF NOT EXISTS items_board ON items (board, id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+            CREATE TABLE IF NOT EXISTS postings (
+                name TEXT NOT NULL, key NOT NULL, id INTEGER NOT NULL, PRIMARY KEY (name, key, id)
+            ) WITHOUT ROWID;
+        """)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            self._conn.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+    def close(self, persist=True):
+        if not self.readonly and persist and self._conn.total_changes:
+            # remove empty boards
+            self._conn.execute("DELETE FROM boards WHERE NOT EXISTS (SELECT 1 FROM items WHERE items.board = boards.name)")
+            self._conn.commit()
+        self._conn.close()
+        self._conn = None
+
+    def flush(self):
+        if not self.readonly and self._conn.in_transaction:
+            self._conn.execute("DELETE FROM boards WHERE NOT EXISTS (SELECT 1 FROM items WHERE items.board = boards.name)")
+            self._conn.commit()
+
+    def _to_item(self, row):
+        id, text, time, due, tick, mark, star, tag = row
+        return Item(id, text, time, due, bool(tick), bool(mark), bool(star), tag)
+
+    def _to_row(self, item):
+        return tuple(getattr(item, key) for key in self.columns)
+
+    def boards(self):
+        rows = self._conn.execute("SELECT name FROM boards WHERE EXISTS (SELECT 1 FROM items WHERE items.board = boards.name) ORDER BY rowid")
+        return [row[0] for row in rows]
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def get_board(self, board):
+        if self._conn.execute("SELECT 1 FROM boards WHERE name = ?", (board,)).fetchone() is None:
+            return None
+        rows = self._conn.execute("SELECT {} FROM items WHERE board = ? ORDER BY id".format(", ".join(self.columns)), (board,))
+        return [self._to_item(row) for row in rows]
+
+    def board_size(self, board):
+        return self._conn.execute("SELECT COUNT(*) FROM items WHERE board = ?", (board,)).fetchone()[0]
+
+    def iter_board(self, board, offset=0, limit=None):
+        rows = self._conn.execute("SELECT {} FROM items WHERE board = ? ORDER BY id LIMIT ? OFFSET ?".format(", ".join(self.columns)),
+                                  (board, -1 if limit is None else limit, offset))
+        return (self._to_item(row) for row in rows)
+
+    def count_flags(self):
+        row = self._conn.execute("SELECT SUM(tick), SUM(mark), SUM(star) FROM items").fetchone()
+        return tuple(n or 0 for n in row)
+
+    def get_item(self, id):
+        row = self._conn.execute("SELECT board, {} FROM items WHERE id = ?".format(", ".join(self.columns)), (id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], self._to_item(row[1:])
+
+    def insert_item(self, board, item):
+        self._conn.execute("INSERT OR IGNORE INTO boards (name) VALUES (?)", (board,))
+        self._conn.execute("INSERT INTO items (board, {}) VALUES (?, {})".format(", ".join(self.columns), ", ".join("?" * len(self.columns))),
+                           (board,) + self._to_row(item))
+
+    def update_item(self, board, item):
+        self._conn.execute("UPDATE items SET {} WHERE id = ?".format(", ".join(key + " = ?" for key in self.columns)), self._to_row(item) + (item.id,))
+
+    def delete_item(self, id):
+        board, item = self.get_item(id)
+        self._conn.execute("DELETE FROM items WHERE id = ?", (id,))
+        return board, item
+
+    def move_item(self, id, board):
+        b, _ = self.get_item(id)
+        self._conn.execute("INSERT OR IGNORE INTO boards (name) VALUES (?)", (board,))
+        self._conn.execute("UPDATE items SET board = ? WHERE id = ?", (board, id))
+        return b
+
+    def index_add(self, name, key, id):
+        self._conn.execute("INSERT OR IGNORE INTO postings (name, key, id) VALUES (?, ?, ?)", (name, key, id))
+
+    def index_discard(self, name, key, id):
+        self._conn.execute("DELETE FROM postings WHERE name = ? AND key = ? AND id = ?", (name, key, id))
+
+    def index_get(self, name, key):
+        return {row[0] for row in self._conn.execute("SELECT id FROM postings WHERE name = ? AND key = ?", (name, key))}
+
+    def index_range(self, name, start=None, stop=None):
+        query = "SELECT key, id FROM postings WHERE name = ?"
+        params = [name]
+        if start is not None:
+            query += " AND key >= ?"
+            params.append(start)
+        if stop is not None:
+            query += " AND key < ?"
+            params.append(stop)
+        return iter(self._conn.execute(query + " ORDER BY key, id", params))
+
+    def index_clear(self, name):
+        self._conn.execute("DELETE FROM postings WHERE name = ?", (name,))
+
+    def get_meta(self, key, default=None):
+        import pickle
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        import pickle
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, pickle.dumps(value)))
+
+
+BACKENDS = {
+    ShelveBackend.name: ShelveBackend,
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+
+def get_backend(name):
+    """Get a new instance of the backend with the given name."""
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError("Unknown storage backend '{}' (available: {})".format(name, ", ".join(BACKENDS)))
@@ -0,0 +1,82 @@
+import re
+
+from .utils import to_datetime
+
+WORD = re.compile(r"\w+")
+
+
+def words(text):
+    """Split text into the lowercased words it is searched by."""
+    return set(WORD.findall(text.lower()))
+
+
+def term_keys(board, item):
+    return words(item.text) | words(item.tag)
+
+
+def tag_keys(board, item):
+    return {item.tag} if item.tag else set()
+
+
+def board_keys(board, item):
+    return {board}
+
+
+def flag_keys(board, item):
+    flags = {"tick": item.tick, "mark": item.mark, "star": item.star, "due": bool(item.due), "tag": bool(item.tag)}
+    return {key for key, value in flags.items() if value}
+
+
+def due_keys(board, item):
+    return {item.due} if item.due else set()
+
+
+def day_keys(board, item):
+    return {to_datetime(item.time).toordinal()} if item.time else set()
+
+
+# Secondary indexes maintained by `Storage` on every operation.
+# Each one maps keys to the ids of the items with the key, which are
+# computed from the board name and the item by the function of the index.
+INDEXES = {
+    "term": term_keys,
+    "tag": tag_keys,
+    "board": board_keys,
+    "flag": flag_keys,
+    "due": due_keys,      # keys are timestamps, iterated in order
+    "day": day_keys,      # keys are ordinals of the dates when the items were added
+}
+
+
+def index_keys(board, item):
+    """Get the keys of an item in every index."""
+    return {name: keys(board, item) for name, keys in INDEXES.items()}
+
+
+FLAGS = ("tick", "mark", "star", "due", "tag")
+
+
+def parse_query(predicates):
+    """Parse predicates of a query into groups of (index name, key, negated) tuples.
+
+    Predicates are either a flag (`tick`, `mark`, `star`, `due` or `tag`), which matches
+    the items with the flag set, `tag=<text>` or `board=<name>`. A predicate prefixed
+    with `no-` matches the opposite items. Items must match every predicate of a group
+    and the groups are separated by `or`.
+    """
+    groups = [[]]
+    for predicate in predicates:
+        if predicate.lower() == "or":
+            groups.append([])
+            continue
+        negated = predicate.startswith("no-")
+        key, sep, value = predicate[3 if negated else 0:].partition("=")
+        if not sep and key in FLAGS:
+            groups[-1].append(("flag", key, negated))
+        elif sep and key in ("tag", "board") and value:
+            groups[-1].append((key, value, negated))
+        else:
+            raise ValueError("Invalid predicate '{}'".format(predicate))
+    if not all(groups):
+        raise ValueError("Empty group of predicates")
+    return groups
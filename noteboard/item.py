@@ -0,0 +1,74 @@
+from .utils import to_datetime
+
+# Version of the on-disk representation of items
+#   1 -- dictionaries with a key for every attribute
+#   2 -- records of `Item.to_record()`
+SCHEMA_VERSION = 2
+
+TICK = 1
+MARK = 2
+STAR = 4
+
+
+class Item:
+    """An item of a board.
+
+    Items are stored as compact records, a tuple of (id, text, time, due, flags, tag),
+    where the tick, mark and star states are packed into the bits of `flags`.
+    """
+
+    __slots__ = ("id", "text", "time", "due", "tick", "mark", "star", "tag")
+    keys = ("id", "text", "time", "date", "due", "tick", "mark", "star", "tag")
+
+    def __init__(self, id, text, time, due=None, tick=False, mark=False, star=False, tag=""):
+        self.id = id            # int
+        self.text = text        # str
+        self.time = time        # float
+        self.due = due          # int
+        self.tick = tick        # bool
+        self.mark = mark        # bool
+        self.star = star        # bool
+        self.tag = tag          # str
+
+    def __repr__(self):
+        return "Item({})".format(", ".join("{}={!r}".format(key, getattr(self, key)) for key in self.__slots__))
+
+    def __eq__(self, other):
+        if not isinstance(other, Item):
+            return NotImplemented
+        return self.to_record() == other.to_record()
+
+    @property
+    def date(self):
+        """Human readable date of when the item was added."""
+        if not self.time:
+            return ""
+        return to_datetime(self.time).strftime("%a %d %b %Y")
+
+    def copy(self):
+        return Item.from_record(self.to_record())
+
+    def to_record(self):
+        flags = (TICK if self.tick else 0) | (MARK if self.mark else 0) | (STAR if self.star else 0)
+        return (self.id, self.text, self.time, self.due, flags, self.tag)
+
+    @classmethod
+    def from_record(cls, record):
+        id, text, time, due, flags, tag = record
+        return cls(id, text, time, due, bool(flags & TICK), bool(flags & MARK), bool(flags & STAR), tag)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.keys}
+
+    @classmethod
+    def from_dict(cls, data):
+        time = data.get("time")
+        return cls(data["id"], data["text"], float(time) if time else time, data.get("due"),
+                   bool(data.get("tick")), bool(data.get("mark")), bool(data.get("star")), data.get("tag") or "")
+
+    @classmethod
+    def load(cls, data):
+        """Make an item from either a record or a dictionary (stored by older versions)."""
+        if isinstance(data, dict):
+            return cls.from_dict(data)
+        return cls.from_record(data)
@@ -0,0 +1,78 @@
+import os
+import signal
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # e.g. on Windows, where the storage is not locked
+    fcntl = None
+
+
+class FileLock:
+    """Advisory lock on a file, which readers share and a writer holds exclusively.
+
+    The lock is released when the file is closed, including when the process exits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, shared=False, timeout=10, interval=0.02):
+        """Wait until the lock is acquired.
+
+        Returns:
+            bool -- False if the lock is still held by another process after `timeout` seconds
+        """
+        if fcntl is None:
+            return True
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self.fd, operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            pass
+        if threading.current_thread() is threading.main_thread() and hasattr(signal, "setitimer"):
+            acquired = self._wait(operation, timeout)
+        else:
+            acquired = self._poll(operation, timeout, interval)
+        if not acquired:
+            self.release()
+        return acquired
+
+    def _wait(self, operation, timeout):
+        # block until the lock is released, which wakes up the waiting processes at once,
+        # unless the alarm interrupts the waiting first
+        def expire(signum, frame):
+            raise TimeoutError
+
+        handler = signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            fcntl.flock(self.fd, operation)
+            return True
+        except TimeoutError:
+            return False
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+
+    def _poll(self, operation, timeout, interval):
+        # signals can only be handled by the main thread
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            try:
+                fcntl.flock(self.fd, operation | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                pass
+        return False
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,56 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger("noteboard")
+
+# calls and seconds of every phase by the names of the phases enclosing it, or None when not profiling
+_phases = None
+_stack = []
+
+
+def start(begin=None):
+    """Start timing the phases, from `begin` (a time of `time.perf_counter`) if the command started earlier."""
+    global _phases
+    _phases = {}
+    _stack.clear()
+    if begin is not None:
+        _phases[("parse",)] = [1, time.perf_counter() - begin]
+
+
+@contextmanager
+def phase(name):
+    """Time the code inside the context as a phase, nested in the phase enclosing it. Nothing is timed unless profiling."""
+    if _phases is None:
+        yield
+        return
+    _stack.append(name)
+    # keep the order in which the phases started, parents before their children
+    totals = _phases.setdefault(tuple(_stack), [0, 0.0])
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        totals[0] += 1
+        totals[1] += time.perf_counter() - begin
+        _stack.pop()
+
+
+def stop():
+    """Stop timing the phases and get a breakdown of them, which is also written to the log.
+
+    Returns:
+        list -- lines of the table of the phases
+    """
+    global _phases
+    phases, _phases = _phases or {}, None
+    total = sum(seconds for path, (_, seconds) in phases.items() if len(path) == 1)
+    lines = ["{:<28} {:>6} {:>10} {:>10} {:>6}".format("Phase", "Calls", "Total", "Self", "%")]
+    for path, (calls, seconds) in phases.items():
+        # the time not spent in any of the nested phases
+        own = seconds - sum(s for p, (_, s) in phases.items() if len(p) == len(path) + 1 and p[:-1] == path)
+        lines.append("{:<28} {:>6} {:>8.1f}ms {:>8.1f}ms {:>5.1f}%".format(
+            "  " * (len(path) - 1) + path[-1], calls, seconds * 1000, own * 1000, 100 * seconds / total if total else 0))
+    lines.append("{:<28} {:>6} {:>8.1f}ms".format("total", "", total * 1000))
+    logger.info("Profile:\n" + "\n".join(lines))
+    return lines
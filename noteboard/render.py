@@ -0,0 +1,152 @@
+import sys
+import datetime
+from colorama import Fore, Style
+
+from . import TAGS
+from .utils import time_diff, to_datetime
+
+
+def get_tag_color(tag):
+    """Get the color of a tag in the config, falling back to the default tag color and then to blue
+    if the color is missing or is not a color of colorama."""
+    name = TAGS.get(tag) or TAGS.get("default") or "BLUE"
+    return getattr(Fore, str(name).upper(), Fore.BLUE)
+
+
+class Renderer:
+    """Render boards into a buffer, which is written to the terminal at once.
+
+    colorama (initialised with `autoreset`) resets the style after every write,
+    so every chunk in the buffer is followed by a reset to produce the same output
+    as printing the chunks one by one.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.tag_colors = {}  # colors of the tags rendered so far
+        self.now = datetime.datetime.now()
+
+    def print(self, *args):
+        chunks = self.chunks
+        for i, arg in enumerate(args):
+            if i:
+                chunks.append(" ")
+            chunks.append(str(arg))
+        chunks.append("\n")
+
+    def p(self, *args):
+        # print text with spaces indented
+        self.print(" ", *args)
+
+    def flush(self):
+        # the last reset is written by colorama itself
+        sys.stdout.write(Style.RESET_ALL.join(self.chunks))
+        sys.stdout.flush()
+        self.chunks = []
+
+    def footer(self, ticks, marks, stars):
+        self.p(Fore.GREEN + str(ticks), Fore.LIGHTBLACK_EX + "done •", Fore.LIGHTRED_EX + str(marks), Fore.LIGHTBLACK_EX + "marked •",
+               Fore.LIGHTYELLOW_EX + str(stars), Fore.LIGHTBLACK_EX + "starred")
+
+    def total(self, total):
+        self.p(Fore.LIGHTCYAN_EX + "Total Items:", Style.DIM + str(total))
+
+    def tag_color(self, tag):
+        # resolve the color of every tag once
+        color = self.tag_colors.get(tag)
+        if color is None:
+            color = self.tag_colors[tag] = get_tag_color(tag)
+        return color
+
+    def item(self, item, date=False, board=None):
+        mark = Fore.BLUE + "●"
+        text_color = ""
+        tag_text = ""
+
+        # tick
+        if item.tick is True:
+            mark = Fore.GREEN + "✔"
+            text_color = Fore.LIGHTBLACK_EX
+
+        # mark
+        if item.mark is True:
+            if item.tick is False:
+                mark = Fore.LIGHTRED_EX + "!"
+            text_color = Style.BRIGHT + Fore.RED
+
+        # tag
+        if item.tag:
+            tag_color = self.tag_color(item.tag)
+            tag_text = " " + tag_color + "(" + item.tag + ")"
+
+        # Star
+        star = " "
+        if item.star is True:
+            star = Fore.LIGHTYELLOW_EX + "⭑"
+
+        # Due date
+        color = ""
+        if item.due:
+            due_days = time_diff(item.due, reverse=True, now=self.now).days + 1  # + 1 because today is included
+            if due_days == 0:
+                color = Fore.RED
+            elif due_days == 1:
+                color = Fore.YELLOW
+            elif due_days == -1:
+                color = Fore.BLUE
+
+        # print text all together
+        if date is True and board is None:
+            self.p(star, Fore.LIGHTMAGENTA_EX + str(item.id).rjust(2), mark, text_color + item.text, tag_text, Fore.LIGHTBLACK_EX + str(item.date),
+                   (Fore.LIGHTBLACK_EX + "(due: {})".format(color + str(to_datetime(item.due)) + Fore.LIGHTBLACK_EX)) if item.due else "")
+            return
+
+        # Day difference
+        days = time_diff(item.time, now=self.now).days
+        if days <= 0:
+            day_text = ""
+        else:
+            day_text = Fore.LIGHTBLACK_EX + "{}d".format(days)
+
+        due_text = ""
+        if item.due:
+            if due_days == 0:
+                text = "today"
+            elif due_days == 1:
+                text = "tomorrow"
+            elif due_days == -1:
+                text = "yesterday"
+            elif due_days < 0:
+                text = "{}d ago".format(due_days*-1)
+            elif due_days > 0:
+                text = "{}d".format(due_days)
+            due_text = "{}(due: {}{})".format(Fore.LIGHTBLACK_EX, color + text, Style.RESET_ALL + Fore.LIGHTBLACK_EX)
+
+        self.p(star, Fore.LIGHTMAGENTA_EX + str(item.id).rjust(2), mark, text_color + item.text + (Style.RESET_ALL + Fore.LIGHTBLUE_EX + "  @" + board if board is not None else ""),
+               tag_text, day_text, due_text)
+
+    def help(self):
+        # print initial help message
+        self.print()
+        c = "`board --help`"
+        self.p(Style.BRIGHT + "Type", Style.BRIGHT + Fore.YELLOW + c, Style.BRIGHT + "to get started")
+
+    def boards(self, groups, date=False, timeline=False, boards=None):
+        """Render boards (or dates in timeline view) with their items.
+
+        Arguments:
+            groups {iterable} -- tuples of board name (or date), total amount of items and an iterable of items
+            date {bool} -- show the added date of every item
+            timeline {bool} -- show the board name after every item, which is looked up in `boards`
+            boards {dict} -- item ids and the names of their boards
+        """
+        for title, size, items in groups:
+            # Print Board title
+            if size == 0:
+                continue
+            self.print()
+            self.p("\033[4m" + Style.BRIGHT + title, Fore.LIGHTBLACK_EX + "[{}]".format(size))
+
+            # Print Item
+            for item in items:
+                self.item(item, date=date, board=boards[item.id] if timeline else None)
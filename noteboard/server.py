@@ -0,0 +1,321 @@
+import io
+import json
+import os
+import sys
+import time
+import logging
+
+from . import SOCKET_PATH, prepare
+
+logger = logging.getLogger("noteboard")
+
+CHUNK_SIZE = 1 << 16
+
+# Protocol of `board serve`, JSON objects sent as lines over a Unix domain socket:
+#   client -> server   {"argv": [...], "cwd": ..., "env": {...}, "tty": [stdin, stdout, stderr]} to run a command
+#   server -> client   {"out": text} or {"err": text} to be written to stdout or stderr
+#   server -> client   {"read": size} to read stdin, answered by {"data": text, "eof": bool}
+#   server -> client   {"exit": code} when the command is finished
+
+
+class Connection:
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile("rwb")
+
+    def send(self, message):
+        self.file.write(json.dumps(message).encode("utf-8") + b"\n")
+        self.file.flush()
+
+    def recv(self):
+        line = self.file.readline()
+        if not line:
+            raise EOFError("Connection closed")
+        return json.loads(line.decode("utf-8"))
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class RemoteOutput(io.TextIOBase):
+    """Output stream of a command run by the server, which is written by the client."""
+
+    def __init__(self, conn, kind, tty):
+        self.conn = conn
+        self.kind = kind
+        self.tty = tty
+        self._pending = []
+        self._size = 0
+
+    def isatty(self):
+        return self.tty
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._pending.append(text)
+        self._size += len(text)
+        if self._size >= CHUNK_SIZE:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending, self._size = [], 0
+            self.conn.send({self.kind: text})
+
+
+class RemoteInput(io.TextIOBase):
+    """Input stream of a command run by the server, which is read from the stdin of the client."""
+
+    def __init__(self, conn, tty, outputs):
+        self.conn = conn
+        self.tty = tty
+        self.outputs = outputs  # flushed before reading, e.g. to show the prompt of `input`
+        self._buffer = ""
+        self._eof = False
+
+    def isatty(self):
+        return self.tty
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        for output in self.outputs:
+            output.flush()
+        self.conn.send({"read": CHUNK_SIZE})
+        reply = self.conn.recv()
+        self._buffer += reply["data"]
+        self._eof = reply["eof"]
+
+    def readline(self, size=-1):
+        while "\n" not in self._buffer and not self._eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find("\n") + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = len(self._buffer) if size < 0 else size
+        text, self._buffer = self._buffer[:end], self._buffer[end:]
+        return text
+
+
+class Server:
+    """Run commands sent by clients with the storage held open, persisting it after a while without any commands.
+
+    Arguments:
+        execute {function} -- runs a command given its arguments, i.e. `noteboard.__main__.execute`
+        delay {float} -- seconds without any commands after which the changes are persisted
+        max_delay {float} -- seconds after which the changes are persisted even if commands keep coming
+    """
+
+    def __init__(self, execute, delay=1.0, max_delay=10.0):
+        self.execute = execute
+        self.delay = delay
+        self.max_delay = max_delay
+        self.storage = None
+        self.sock = None
+        self.busy = False
+        self.stopping = False
+
+    def _stop(self, signum, frame):
+        # let the current command finish before stopping
+        if self.busy:
+            self.stopping = True
+        else:
+            raise KeyboardInterrupt
+
+    def start(self):
+        """Open the storage and listen on the socket."""
+        import socket
+        from .storage import Storage, NoteboardException
+        if not hasattr(socket, "AF_UNIX"):
+            raise NoteboardException("Unix domain sockets are not supported on this platform")
+        if is_running():
+            raise NoteboardException("Server is already running on {}".format(SOCKET_PATH))
+        prepare()
+        # hold the storage until the server stops, commands run by the server do not open it again
+        self.storage = Storage()
+        self.storage.open()
+        Storage.resident[self.storage.backend.name] = self.storage
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if os.path.exists(SOCKET_PATH):
+                # left behind by a server which did not stop cleanly
+                os.remove(SOCKET_PATH)
+            # only the user may connect
+            umask = os.umask(0o177)
+            try:
+                sock.bind(SOCKET_PATH)
+            finally:
+                os.umask(umask)
+            sock.listen(16)
+        except BaseException:
+            sock.close()
+            del Storage.resident[self.storage.backend.name]
+            self.storage.close()
+            raise
+        self.sock = sock
+        logger.debug("Serving {} storage on {}".format(self.storage.backend.name, SOCKET_PATH))
+
+    def serve_forever(self):
+        """Serve clients until SIGINT or SIGTERM is received, then persist and close the storage."""
+        import signal
+        import socket
+        from .storage import Storage
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        sock = self.sock
+        first = last = None  # times of the first and the last command since the changes were persisted
+        try:
+            while not self.stopping:
+                if first is None:
+                    sock.settimeout(None)
+                else:
+                    sock.settimeout(max(0, min(last + self.delay, first + self.max_delay) - time.monotonic()))
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    self.busy = True
+                    try:
+                        self.flush()
+                    finally:
+                        self.busy = False
+                    first = last = None
+                    continue
+                conn.settimeout(None)
+                self.busy = True
+                try:
+                    self.handle(Connection(conn))
+                finally:
+                    self.busy = False
+                last = time.monotonic()
+                first = first or last
+        finally:
+            sock.close()
+            os.remove(SOCKET_PATH)
+            del Storage.resident[self.storage.backend.name]
+            try:
+                self.storage.checkpoint()
+            finally:
+                self.storage.close()
+            logger.debug("Stopped serving")
+
+    def flush(self):
+        start = time.perf_counter()
+        try:
+            self.storage.checkpoint()
+        except Exception:
+            # retried after the next command
+            logger.debug("(ERROR) Failed to persist the storage", exc_info=True)
+        else:
+            logger.debug("Persisted the storage in {:.3f}s".format(time.perf_counter() - start))
+
+    def handle(self, conn):
+        try:
+            request = conn.recv()
+            logger.debug("Run command: {}".format(request["argv"]))
+            code = self.run(conn, request)
+            conn.send({"exit": code})
+        except Exception:
+            # e.g. the client has gone away, which must not stop the server
+            logger.debug("(ERROR) Failed to serve a client", exc_info=True)
+        finally:
+            conn.close()
+
+    def run(self, conn, request):
+        stdin_tty, stdout_tty, stderr_tty = request["tty"]
+        streams = sys.stdin, sys.stdout, sys.stderr
+        cwd, environ = os.getcwd(), dict(os.environ)
+        sys.stdout = RemoteOutput(conn, "out", stdout_tty)
+        sys.stderr = RemoteOutput(conn, "err", stderr_tty)
+        sys.stdin = RemoteInput(conn, stdin_tty, (sys.stdout, sys.stderr))
+        # run the command as if it was run by the client, e.g. with relative paths and $SHELL of the client
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        code = 0
+        try:
+            try:
+                self.execute(request["argv"])
+            except SystemExit as e:
+                # e.g. --help or invalid arguments
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = streams
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+        return code
+
+
+def is_running():
+    """Check whether a server is listening on the socket."""
+    import socket
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(SOCKET_PATH):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(SOCKET_PATH)
+        except OSError:
+            return False
+    return True
+
+
+def forward(argv):
+    """Run a command on the server and write its output.
+
+    Returns:
+        int -- exit code of the command, or None if no server is running
+    """
+    import codecs
+    import socket
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET_PATH)
+    except OSError:
+        sock.close()
+        return None
+    conn = Connection(sock)
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    try:
+        conn.send({
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+            "tty": [sys.stdin.isatty(), sys.stdout.isatty(), sys.stderr.isatty()],
+        })
+        while True:
+            message = conn.recv()
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "err" in message:
+                sys.stderr.write(message["err"])
+                sys.stderr.flush()
+            elif "read" in message:
+                data = os.read(sys.stdin.fileno(), message["read"])
+                conn.send({"data": decoder.decode(data, final=not data), "eof": not data})
+            elif "exit" in message:
+                return message["exit"]
+    except KeyboardInterrupt:
+        return 130
+    except (EOFError, OSError):
+        sys.stderr.write("✘ Lost the connection to the server\n")
+        return 1
+    finally:
+        conn.close()
@@ -1,14 +1,27 @@
-import shelve
-import gzip
-import shutil
+import datetime
 import json
 import os
+import re
+import time
 import logging
+from contextlib import contextmanager
 
-from . import DIR_PATH, HISTORY_PATH, STORAGE_PATH, STORAGE_GZ_PATH, DEFAULT_BOARD
-from .utils import get_time, to_datetime
+from . import HISTORY_PATH, LEGACY_HISTORY_PATH, HISTORY_RETENTION, DEFAULT_BOARD, BACKEND, prepare
+from .backends import get_backend, META_PREFIX
+from .item import Item
+from .index import INDEXES, index_keys, words, parse_query
+from .lock import FileLock
+from .profiling import phase
+from .wal import WriteAheadLog
+from .utils import get_time
 
 logger = logging.getLogger("noteboard")
+LOCK_TIMEOUT = 10  # seconds to wait for other processes to release the storage
+CHECKPOINT_SIZE = 1 << 20  # bytes of the write-ahead log after which the changes are checkpointed to the backend
+LOG_LIMIT = 10000  # operations of a commit above which the backend is checkpointed instead of logging them
+SEGMENT_SIZE = 1 << 18  # bytes of the history file after which it is sealed and a new one is started
+# sealed segments of the history, named by the id of their first entry and gzipped once compacted
+SEGMENT = re.compile(r"^history\.(\d+)\.jsonl(\.gz)?$")
 
 
 class NoteboardException(Exception):
@@ -35,65 +48,411 @@ class BoardNotFoundError(NoteboardException):
         return "Board '{}' not found".format(self.name)
 
 
+class StorageLockedError(NoteboardException):
+    """Raised when the storage is still being used by another process after waiting."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def __str__(self):
+        return "Storage is being used by another process (waited for {} seconds)".format(self.timeout)
+
+
 class History:
+    """Append-only journal of actions.
+
+    Every entry holds the operations which undo the action, instead of a copy of all boards.
+    Undone entries stay in the journal and are marked by a later `undo` entry.
+
+    Entries are appended to `history.jsonl`, which is sealed as a segment once it is large enough,
+    so that only the newest segment is read to undo an action. The oldest segments are removed
+    according to the retention limits, whenever a segment is sealed and by `compact`.
+    """
+
+    date_format = "%d %b %Y %X"
 
     def __init__(self, storage):
         self.storage = storage
-        self.buffer = None
+        self.buffer = None  # inverse operations recorded since `save`
+        self.last_id = None  # id of the latest entry, once it is known from reading the journal
+
+    @staticmethod
+    def _migrate():
+        # convert the snapshots of the gzipped history of older versions to journal entries
+        if not os.path.isfile(LEGACY_HISTORY_PATH):
+            return
+        import gzip
+        with gzip.open(LEGACY_HISTORY_PATH, "r") as j:
+            history = json.loads(j.read().decode("utf-8"))
+        with open(HISTORY_PATH, "a") as f:
+            for id, state in enumerate(history, 1):
+                ops = [["restore", state["data"]]] if state["data"] is not None else None
+                entry = {"id": id, "action": state["action"], "info": state["info"], "date": state["date"], "ops": ops}
+                f.write(json.dumps(entry) + "\n")
+        os.remove(LEGACY_HISTORY_PATH)
+        logger.debug("Migrated {} entries of legacy history".format(len(history)))
 
     @staticmethod
-    def load():
+    def segments():
+        """Get the sealed segments of the journal from the oldest to the newest.
+
+        Returns:
+            list -- tuples of the id of the first entry and the path of every segment
+        """
+        directory = os.path.dirname(HISTORY_PATH)
         try:
-            with gzip.open(HISTORY_PATH, "r") as j:
-                history = json.loads(j.read().decode("utf-8"))
+            names = os.listdir(directory)
         except FileNotFoundError:
-            raise NoteboardException("History file not found for loading")
-        return history
-
-    def revert(self):
-        history = History.load()
-        hist = [i for i in history if i["data"] is not None]
-        if len(hist) == 0:
-            return {}
-        state = hist[-1]
-        logger.debug("Revert state: {}".format(state))
-        # Update the shelf
-        self.storage.shelf.clear()
-        self.storage.shelf.update(dict(state["data"]))
-        # Remove state from history
-        history.remove(state)
-        # Update the history file
-        with gzip.open(HISTORY_PATH, "w") as j:
-            j.write(json.dumps(history).encode("utf-8"))
+            return []
+        segments = {}
+        for name in names:
+            match = SEGMENT.match(name)
+            # a segment may be left uncompressed next to its archive if compacting was interrupted
+            if match and (not match.group(2) or int(match.group(1)) not in segments):
+                segments[int(match.group(1))] = os.path.join(directory, name)
+        return sorted(segments.items())
+
+    @staticmethod
+    def iter_entries():
+        """Iterate over the entries of the journal from the oldest to the newest, one segment at a time."""
+        History._migrate()
+        for _, path in History.segments() + [(None, HISTORY_PATH)]:
+            if path.endswith(".gz"):
+                import gzip
+                f = gzip.open(path, "rb")
+            else:
+                try:
+                    f = open(path, "rb")
+                except FileNotFoundError:
+                    continue
+            with f:
+                for line in f:
+                    # skip an entry which was not completely written
+                    if line.strip() and line.endswith(b"\n"):
+                        yield json.loads(line.decode("utf-8"))
+
+    @staticmethod
+    def iter_reversed():
+        """Iterate over the entries of the journal from the newest to the oldest."""
+        History._migrate()
+        yield from History._read_reversed(HISTORY_PATH)
+        for _, path in reversed(History.segments()):
+            yield from History._read_reversed(path)
+
+    @staticmethod
+    def _read_reversed(path):
+        # iterate over the entries of a segment from the newest to the oldest
+        if path.endswith(".gz"):
+            import gzip
+            with gzip.open(path, "rb") as f:
+                lines = f.read().split(b"\n")
+            for line in reversed(lines):
+                if line.strip():
+                    yield json.loads(line.decode("utf-8"))
+            return
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            pos = History._end(f)
+            # blocks of the line which is not completely read yet, from the last to the first
+            rest = []
+            while pos > 0:
+                step = min(8192, pos)
+                pos -= step
+                f.seek(pos)
+                block = f.read(step)
+                if b"\n" not in block:
+                    # an entry spanning several blocks (e.g. clearing a large board) is joined once its start is read
+                    rest.append(block)
+                    continue
+                lines = (block + b"".join(reversed(rest))).split(b"\n")
+                # the first line may be incomplete until the previous block is read
+                rest = [lines.pop(0)]
+                for line in reversed(lines):
+                    if line.strip():
+                        yield json.loads(line.decode("utf-8"))
+            line = b"".join(reversed(rest))
+            if line.strip():
+                yield json.loads(line.decode("utf-8"))
+
+    @staticmethod
+    def _end(f):
+        # get the position after the last complete entry, as an entry
+        # which does not end with a newline was not completely written
+        pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(8192, pos)
+            f.seek(pos - step)
+            index = f.read(step).rfind(b"\n")
+            if index >= 0:
+                return pos - step + index + 1
+            pos -= step
+        return 0
+
+    @staticmethod
+    def latest(amount=None, action=None, since=None):
+        """Get the latest entries matching the filters, reading the journal backwards only as far as needed.
+
+        Arguments:
+            amount {int} -- maximum amount of entries
+            action {str} -- only get entries of this action
+            since {datetime.date} -- only get entries of this date or later
+
+        Returns:
+            list -- entries from the oldest to the newest
+        """
+        entries = []
+        for entry in History.iter_reversed():
+            if since is not None:
+                try:
+                    date = datetime.datetime.strptime(entry["date"], History.date_format).date()
+                except ValueError:
+                    date = None
+                if date is not None and date < since:
+                    # every entry from here on is older
+                    break
+            if action is not None and entry["action"] != action:
+                continue
+            entries.append(entry)
+            if amount is not None and len(entries) >= amount:
+                break
+        entries.reverse()
+        return entries
+
+    def iter_undoable(self):
+        """Iterate over the entries which can be undone, from the newest to the oldest."""
+        undone = {}  # entry id -> whether the latest undo or redo of the entry undid it
+        self.last_id = None
+        for entry in History.iter_reversed():
+            if self.last_id is None:
+                self.last_id = entry["id"]
+            if entry.get("undo") is not None:
+                for id in _entry_ids(entry["undo"]):
+                    undone.setdefault(id, True)
+            elif entry.get("redo") is not None:
+                for id in entry["redo"]:
+                    undone.setdefault(id, False)
+            elif entry["ops"] is not None and not undone.get(entry["id"]):
+                yield entry
+
+    def iter_redoable(self):
+        """Iterate over the undone entries which can be redone, from the last undone one.
+        Entries undone before the latest action (which is not an undo or a redo) cannot be redone.
+
+        Yields:
+            dict -- id, action and info of the undone entry, and the operations which redo it
+        """
+        undone = {}
+        self.last_id = None
+        for entry in History.iter_reversed():
+            if self.last_id is None:
+                self.last_id = entry["id"]
+            if entry.get("undo") is not None:
+                if "reapply" not in entry:
+                    # undone by an older version, which did not keep the operations
+                    return
+                # the entries were undone from the newest one
+                for redo in reversed(entry["reapply"]):
+                    if redo["id"] not in undone:
+                        undone[redo["id"]] = True
+                        yield redo
+            elif entry.get("redo") is not None:
+                for id in entry["redo"]:
+                    undone.setdefault(id, False)
+            elif entry["ops"] is not None:
+                return
+
+    def revert(self, entries):
+        """Undo entries of `iter_undoable` in the given order, recording them as a single entry.
+
+        Returns:
+            dict -- the written entry
+        """
+        reapply = []
+        try:
+            for entry in entries:
+                logger.debug("Revert state: {}".format(entry))
+                # apply the inverse operations in reverse order, keeping their inverses to redo the entry
+                ops = [self.storage._apply(op) for op in reversed(entry["ops"])]
+                reapply.append({"id": entry["id"], "action": entry["action"], "info": entry["info"], "ops": ops})
+        except BaseException:
+            self._rollback(op for redo in reapply for op in redo["ops"])
+            raise
+        info = "; ".join("undone [{}] {}".format(entry["action"], entry["info"]) for entry in entries)
+        return self._append("undo", info, None, undo=[entry["id"] for entry in entries], reapply=reapply)
+
+    def reapply(self, redos):
+        """Redo entries of `iter_redoable` in the given order, recording them as a single entry.
+
+        Returns:
+            dict -- the written entry
+        """
+        applied = []
+        try:
+            for redo in redos:
+                for op in reversed(redo["ops"]):
+                    applied.append(self.storage._apply(op))
+        except BaseException:
+            self._rollback(applied)
+            raise
+        info = "; ".join("redone [{}] {}".format(redo["action"], redo["info"]) for redo in redos)
+        return self._append("redo", info, None, redo=[redo["id"] for redo in redos])
+
+    def _rollback(self, inverses):
+        # revert the operations applied so far, given their inverses in the order they were applied
+        inverses = list(inverses)
+        logger.debug("Rolling back {} operations".format(len(inverses)))
+        for op in reversed(inverses):
+            self.storage._apply(op)
+
+    def save(self):
+        self.buffer = []
+
+    def record(self, op):
+        if self.buffer is not None:
+            self.buffer.append(op)
+
+    def _append(self, action, info, ops, **extra):
+        # read-only storages are shared by several processes (e.g. exporting), which must not append at the same time
+        lock = FileLock(HISTORY_PATH + ".lock")
+        if not lock.acquire(timeout=LOCK_TIMEOUT):
+            raise StorageLockedError(LOCK_TIMEOUT)
+        try:
+            return self._write_entry(action, info, ops, extra)
+        finally:
+            lock.release()
+
+    def _write_entry(self, action, info, ops, extra):
+        if self.last_id is None or self.storage.readonly:
+            # the latest entry may have been appended by another read-only storage since
+            last = next(History.iter_reversed(), None)
+            self.last_id = last["id"] if last else 0
+        state = {"id": self.last_id + 1, "action": action, "info": info, "date": get_time(History.date_format)[0], "ops": ops}
+        state.update(extra)
+        logger.debug("Write history: {}".format(state))
+        # the operations of the entry must be in the storage before the entry is in the history
+        self.storage._commit()
+        with phase("history"), open(HISTORY_PATH, "a+b") as f:
+            end = History._end(f)
+            if end < f.seek(0, os.SEEK_END):
+                # cut off an entry which was not completely written
+                f.truncate(end)
+            f.write((json.dumps(state) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            full = f.tell() >= SEGMENT_SIZE
+        self.last_id = state["id"]
+        if full:
+            History._seal()
         return state
 
-    def save(self, data):
-        self.buffer = data.copy()
+    @staticmethod
+    def _seal():
+        # keep the full history file as a segment, the next entry starts a new one
+        with open(HISTORY_PATH, "rb") as f:
+            first = json.loads(f.readline().decode("utf-8"))
+        os.replace(HISTORY_PATH, os.path.join(os.path.dirname(HISTORY_PATH), "history.{:08d}.jsonl".format(first["id"])))
+        logger.debug("Sealed history segment from entry {}".format(first["id"]))
+        History.prune(**HISTORY_RETENTION)
+
+    @staticmethod
+    def prune(entries=None, days=None, size=None):
+        """Remove the oldest segments whose entries are all beyond a retention limit.
+        The latest entries, which have not been sealed yet, are always kept.
+
+        Arguments:
+            entries {int} -- amount of the latest entries to keep
+            days {float} -- remove the entries older than this amount of days
+            size {int} -- maximum size of all segments in bytes
+
+        Returns:
+            int -- amount of entries removed
+        """
+        segments = History.segments()
+        if not segments:
+            return 0
+        last = next(History.iter_reversed())
+        total = sum(os.path.getsize(path) for _, path in segments)
+        if os.path.isfile(HISTORY_PATH):
+            total += os.path.getsize(HISTORY_PATH)
+        removed = 0
+        for i, (first, path) in enumerate(segments):
+            # id of the entry after the segment
+            end = segments[i + 1][0] if i + 1 < len(segments) else History._first_id(HISTORY_PATH, last["id"] + 1)
+            expired = (entries is not None and last["id"] + 1 - end >= entries) \
+                or (days is not None and os.path.getmtime(path) < time.time() - days * 86400) \
+                or (size is not None and total > size)
+            if not expired:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+            removed += end - first
+            logger.debug("Removed history segment of entries {} to {}".format(first, end - 1))
+        return removed
+
+    @staticmethod
+    def _first_id(path, default):
+        try:
+            with open(path, "rb") as f:
+                line = f.readline()
+        except FileNotFoundError:
+            return default
+        return json.loads(line.decode("utf-8"))["id"] if line.endswith(b"\n") else default
+
+    @staticmethod
+    def compact(entries=None, days=None, size=None):
+        """Remove the segments beyond the retention limits (see `prune`) and gzip the other sealed segments.
+
+        Returns:
+            int -- amount of entries removed
+            int -- amount of segments archived
+        """
+        removed = History.prune(entries, days, size)
+        import gzip
+        import shutil
+        archived = 0
+        for _, path in History.segments():
+            if path.endswith(".gz"):
+                continue
+            # the modification time of a segment is the time of its last entry
+            mtime = os.path.getmtime(path)
+            tmp = path + ".gz.tmp"
+            with open(path, "rb") as f_in, gzip.open(tmp, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.utime(tmp, (mtime, mtime))
+            os.replace(tmp, path + ".gz")
+            os.remove(path)
+            archived += 1
+        return removed, archived
 
     def write(self, action, info):
-        is_new = not os.path.isfile(HISTORY_PATH)
-
-        # Create and initialise history file with an empty list
-        if is_new:
-            with gzip.open(HISTORY_PATH, "w+") as j:
-                j.write(json.dumps([]).encode("utf-8"))
-
-        # Write data to disk
-        # => read the current saved states
-        history = History.load()
-        # => dump history data
-        state = {"action": action, "info": info, "date": get_time("%d %b %Y %X")[0], "data": dict(self.buffer) if self.buffer else self.buffer}
-        logger.debug("Write history: {}".format(state))
-        history.append(state)
-        with gzip.open(HISTORY_PATH, "w") as j:
-            j.write(json.dumps(history).encode("utf-8"))
+        self._append(action, info, self.buffer)
         self.buffer = None  # empty the buffer
 
 
+def _entry_ids(undo):
+    # entries written by older versions undo a single entry
+    return undo if isinstance(undo, list) else [undo]
+
+
 class Storage:
 
-    def __init__(self):
-        self._shelf = None
+    # storages held open by `board serve` by backend name, whose backend is used instead of opening and closing it
+    resident = {}
+
+    def __init__(self, backend=None, readonly=False):
+        self.backend = get_backend(backend or BACKEND)
+        self.readonly = readonly
+        self._opened = False
+        self._resident = False
+        self._lock = None
+        self.wal = None
+        self._log = None        # operations since the last commit to the write-ahead log
+        self._unlogged = False  # whether there were too many operations to be logged
+        self._checkpoint = False
+        self._transaction = None  # (action, info) of actions in the current transaction
         self.history = History(self)
 
     def __enter__(self):
@@ -105,139 +464,546 @@ class Storage:
         return False
 
     def open(self):
-        # Open shelf
-        if self._shelf is not None:
-            raise NoteboardException("Shelf object has already been opened.")
+        if self._opened:
+            raise NoteboardException("Storage has already been opened.")
+        with phase("open"):
+            self._open()
 
-        if not os.path.isdir(DIR_PATH):
-            logger.debug("Making directory {} ...".format(DIR_PATH))
-            os.mkdir(DIR_PATH)
+    def _open(self):
+        resident = Storage.resident.get(self.backend.name)
+        self._resident = resident is not None
+        if self._resident:
+            # share the backend and the write-ahead log held open by `board serve`
+            self.backend = resident.backend
+            self.wal = resident.wal
+        else:
+            prepare()
+            # readers share the storage, a writer has it to itself
+            self._lock = FileLock(self.backend.path + ".lock")
+            with phase("lock"):
+                acquired = self._lock.acquire(shared=self.readonly, timeout=LOCK_TIMEOUT)
+            if not acquired:
+                raise StorageLockedError(LOCK_TIMEOUT)
+            try:
+                with phase("load"):
+                    self.backend.open(readonly=self.readonly)
+            except BaseException:
+                self._lock.release()
+                raise
+            if self.backend.journaled:
+                self.wal = WriteAheadLog(self.backend.path + ".wal")
+        self._opened = True
+        self._log = [] if self.wal is not None else None
+        self._unlogged, self._checkpoint = False, False
+        if self.wal is not None and not self._resident:
+            with phase("recover"):
+                self._recover()
+        if not self.readonly and self.backend.get_meta("next_id") is None:
+            # migrate stores created before the id counter existed
+            self._bump_next_id()
+            self._checkpoint = True
+        self._indexed = set(self.backend.get_meta("indexes", []))
+        if not self.readonly and self._build_indexes():
+            self._checkpoint = True
 
-        if os.path.isfile(STORAGE_GZ_PATH):
-            # decompress compressed storage.gz to a storage file
-            with gzip.open(STORAGE_GZ_PATH, "rb") as f_in:
-                with open(STORAGE_PATH, "wb") as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-            os.remove(STORAGE_GZ_PATH)
+    def close(self):
+        if not self._opened:
+            raise NoteboardException("No opened storage to be closed.")
+        with phase("close"):
+            self._close()
 
-        self._shelf = shelve.open(STORAGE_PATH, "c", writeback=True)
+    def _close(self):
+        try:
+            if not self.readonly:
+                self._commit()
+                # the server checkpoints the resident storage by itself
+                if not self._resident and self.wal is not None and (self._checkpoint or self.wal.size() >= CHECKPOINT_SIZE):
+                    self.checkpoint()
+        finally:
+            if not self._resident:
+                try:
+                    # the changes since the last checkpoint are kept by the write-ahead log
+                    with phase("persist"):
+                        self.backend.close(persist=self.wal is None)
+                finally:
+                    self._lock.release()
+            self._opened = False
 
-    def close(self):
-        if self._shelf is None:
-            raise NoteboardException("No opened shelf object to be closed.")
-
-        # Cleanup
-        for board in self.shelf:
-            # remove empty boards
-            if not self.shelf[board]:
-                self.shelf.pop(board)
-                continue
-            # always sort items on the boards before closing
-            self.shelf[board] = list(sorted(self.shelf[board], key=lambda x: x["id"]))
-        self._shelf.close()
+    def _recover(self):
+        """Replay the operations committed to the write-ahead log after the last checkpoint."""
+        commits = self.wal.recover(self.backend.get_meta("wal_seq", 0), repair=not self.readonly)
+        if not commits:
+            return
+        # read-only storages replay the operations to their own copy of the backend
+        readonly, self.readonly = self.readonly, False
+        log, self._log = self._log, None
+        try:
+            for ops in commits:
+                for op in ops:
+                    self._apply(op)
+        finally:
+            self.readonly, self._log = readonly, log
+        ids = [op[2]["id"] for ops in commits for op in ops if op[0] == "insert"]
+        if ids and not self.readonly:
+            # the id counter is only persisted by checkpoints
+            self._bump_next_id(max(ids) + 1)
+        logger.debug("Recovered {} commits from the write-ahead log".format(len(commits)))
 
-        # compress storage to storage.gz
-        with gzip.open(STORAGE_GZ_PATH, "wb") as f_out:
-            with open(STORAGE_PATH, "rb") as f_in:
-                shutil.copyfileobj(f_in, f_out)
-        os.remove(STORAGE_PATH)
+    def _commit(self):
+        """Make the operations since the last commit durable, before they are written to the history."""
+        if self.wal is None:
+            # backends without a write-ahead log commit the changes by themselves, e.g. a sqlite transaction
+            with phase("commit"):
+                self.backend.flush()
+            return
+        if self._unlogged:
+            self._unlogged = False
+            self.checkpoint()
+        elif self._log:
+            with phase("commit"):
+                self.wal.append(self._log)
+        self._log = []
 
-    @property
-    def shelf(self):
-        """Use this property to access the shelf object from the outside."""
-        if self._shelf is None:
-            raise NoteboardException("No opened shelf object to be accessed.")
-        return self._shelf
+    def checkpoint(self):
+        """Persist the changes to the backend and empty the write-ahead log."""
+        self._check_writable()
+        with phase("checkpoint"):
+            self._commit()
+            if self.wal is not None and self.wal.seq != self.backend.get_meta("wal_seq", 0):
+                # recovery skips the commits up to here, even if the log could not be emptied
+                self.backend.set_meta("wal_seq", self.wal.seq)
+            self.backend.flush()
+            if self.wal is not None:
+                self.wal.truncate()
+
+    def _bump_next_id(self, next_id=None):
+        # make sure the next allocated id is greater than every existing id
+        if next_id is None:
+            next_id = max((item.id for item in self.get_all_items()), default=0) + 1
+        if next_id > self.backend.get_meta("next_id", 1):
+            self.backend.set_meta("next_id", next_id)
+
+    def _build_indexes(self):
+        """Build the secondary indexes which are missing from the store, e.g. a store written by an older version.
+
+        Returns:
+            bool -- whether any index was built
+        """
+        missing = [name for name in INDEXES if name not in self._indexed]
+        if not missing:
+            return False
+        for name in missing:
+            self.backend.index_clear(name)
+        for board in self.boards:
+            for item in self.backend.iter_board(board):
+                for name in missing:
+                    for key in INDEXES[name](board, item):
+                        self.backend.index_add(name, key, item.id)
+        self._indexed.update(missing)
+        self.backend.set_meta("indexes", sorted(self._indexed))
+        logger.debug("Built indexes: {}".format(", ".join(missing)))
+        return True
+
+    def _reindex(self, id, old, new):
+        # update the secondary indexes of an item, given its keys (of `index_keys`) before and after a change
+        for name in INDEXES:
+            before = old[name] if old else set()
+            after = new[name] if new else set()
+            for key in before - after:
+                self.backend.index_discard(name, key, id)
+            for key in after - before:
+                self.backend.index_add(name, key, id)
+
+    def _check_writable(self):
+        if self.readonly:
+            raise NoteboardException("Storage is opened in read-only mode")
+
+    def _next_id(self):
+        """Allocate a new item id. Ids are never reused, even after the item is removed."""
+        self._check_writable()
+        id = self.backend.get_meta("next_id", 1)
+        self.backend.set_meta("next_id", id + 1)
+        return id
+
+    def _apply(self, op):
+        """Apply an operation to the backend and record the operation which reverts it to the history.
+
+        Operations are JSON serialisable lists:
+            ["insert", board, item] -- insert an item (`Item` or dictionary) to a board
+            ["delete", id] -- delete an item
+            ["update", id, key, value] -- set the value of a key of an item
+            ["move", id, board] -- move an item to a board
+            ["restore", boards] -- overwrite all boards (only found in history of older versions)
+
+        Returns:
+            list -- the inverse operation
+        """
+        self._check_writable()
+        name = op[0]
+        if name == "insert":
+            _, board, item = op
+            if not isinstance(item, Item):
+                item = Item.from_dict(item)
+            self._insert(board, item)
+            inverse = ["delete", item.id]
+            op = ["insert", board, item.to_dict()]
+        elif name == "delete":
+            board, item = self._delete(op[1])
+            inverse = ["insert", board, item.to_dict()]
+        elif name == "update":
+            _, id, key, value = op
+            board, item = self.backend.get_item(id)
+            inverse = ["update", id, key, getattr(item, key)]
+            old = index_keys(board, item)
+
+            def revert():
+                setattr(item, key, inverse[3])
+                self.backend.update_item(board, item)
+
+            setattr(item, key, value)
+            try:
+                new = index_keys(board, item)
+                self.backend.update_item(board, item)
+            except BaseException:
+                revert()
+                raise
+            self._reindex_or_revert(id, old, new, revert)
+        elif name == "move":
+            _, id, board = op
+            b, item = self.backend.get_item(id)
+            old, new = index_keys(b, item), index_keys(board, item)
+            self.backend.move_item(id, board)
+            self._reindex_or_revert(id, old, new, lambda: self.backend.move_item(id, b))
+            inverse = ["move", id, b]
+        elif name == "restore":
+            inverse = ["restore", {board: [item.to_dict() for item in items] for board, items in self.get_all_boards().items()}]
+            for item in reversed(self.get_all_items()):
+                self._delete(item.id)
+            for board, items in op[1].items():
+                for item in items:
+                    self._insert(board, Item.from_dict(item))
+            self._bump_next_id()
+        else:
+            raise ValueError("Unknown operation '{}'".format(name))
+        self.history.record(inverse)
+        if self._log is not None and not self._unlogged:
+            if len(self._log) < LOG_LIMIT:
+                self._log.append(op)
+            else:
+                # persist the backend at the commit instead of logging the operations
+                self._unlogged = True
+                self._log = []
+        return inverse
+
+    def _insert(self, board, item):
+        # get the keys first, which fails for an invalid item before anything is changed
+        keys = index_keys(board, item)
+        self.backend.insert_item(board, item)
+        self._reindex_or_revert(item.id, None, keys, lambda: self.backend.delete_item(item.id))
+
+    def _delete(self, id):
+        board, item = self.backend.delete_item(id)
+        try:
+            keys = index_keys(board, item)
+        except BaseException:
+            self.backend.insert_item(board, item)
+            raise
+        self._reindex_or_revert(id, keys, None, lambda: self.backend.insert_item(board, item))
+        return board, item
+
+    def _reindex_or_revert(self, id, old, new, revert):
+        # an operation must be applied completely or not at all, since no inverse is recorded for it if it fails
+        try:
+            self._reindex(id, old, new)
+        except BaseException:
+            self._reindex(id, new, old)
+            revert()
+            raise
+
+    def _replace_all(self, data):
+        # overwrite all boards with `data` item by item, keeping the id counter
+        # (from the last item of each board, which is the cheapest to delete)
+        for item in reversed(self.get_all_items()):
+            self._apply(["delete", item.id])
+        for board in data:
+            for item in data[board]:
+                self._apply(["insert", board, item])
+        self._bump_next_id()
 
     @property
     def boards(self):
         """Get all existing board titles."""
-        return list(self.shelf.keys())
+        return self.backend.boards()
 
     @property
     def items(self):
         """Get all existing items with ids and texts."""
-        results = {}
-        for board in self.shelf:
-            for item in self.shelf[board]:
-                results[item["id"]] = item["text"]
-        return results
+        return {item.id: item.text for item in self.get_all_items()}
 
     @property
     def total(self):
         """Get the total amount of items in all boards."""
-        return len(self.items)
+        return self.backend.count()
 
     def get_item(self, id):
         """Get the item with the give ID. ItemNotFoundError will be raised if nothing found."""
-        for board in self.shelf:
-            for item in self.shelf[board]:
-                if item["id"] == id:
-                    return item
-        raise ItemNotFoundError(id)
+        result = self.backend.get_item(id)
+        if result is None:
+            raise ItemNotFoundError(id)
+        return result[1]
 
     def get_board(self, name):
         """Get the board with the given name. BoardNotFound will be raised if nothing found."""
-        for board in self.shelf:
-            if board == name:
-                return self.shelf[name]
-        raise BoardNotFoundError(name)
+        items = self.backend.get_board(name)
+        if items is None:
+            raise BoardNotFoundError(name)
+        return items
+
+    def get_all_boards(self):
+        """Get a dictionary of all boards and their items."""
+        return {board: self.backend.get_board(board) for board in self.boards}
+
+    def iter_boards(self, board=None, offset=0, limit=None, key=None, reverse=False):
+        """Iterate over a slice of the items of one or all boards, lazily loading only the boards in the slice.
+
+        Arguments:
+            board {str} -- name of the only board to iterate over
+            offset {int} -- amount of items to skip
+            limit {int} -- maximum amount of items to iterate over
+            key {function} -- sort the items of each board with this key instead of their ids
+            reverse {bool} -- sort the items in reverse order
+
+        Yields:
+            str -- name of the board
+            int -- total amount of items in the board
+            iterator -- items of the board in the slice
+        """
+        for name in ([board] if board is not None else self.boards):
+            size = self.backend.board_size(name)
+            if offset >= size:
+                offset -= size
+                continue
+            count = size - offset if limit is None else min(size - offset, limit)
+            if key is None:
+                items = self.backend.iter_board(name, offset, count)
+            else:
+                items = iter(sorted(self.backend.iter_board(name), key=key, reverse=reverse)[offset:offset + count])
+            yield name, size, items
+            offset = 0
+            if limit is not None:
+                limit -= count
+                if limit == 0:
+                    return
+
+    def iter_timeline(self, since=None, until=None, board=None, offset=0, limit=None):
+        """Iterate over the items day by day in the order of the dates they were added, through the timeline index.
+
+        Arguments:
+            since {datetime.date} -- the first day to iterate over
+            until {datetime.date} -- the last day to iterate over
+            board {str} -- only iterate over the items of this board
+            offset {int} -- amount of items to skip
+            limit {int} -- maximum amount of items to iterate over
+
+        Yields:
+            datetime.date -- the day
+            list -- tuples of board name and item added on the day, sorted by id
+        """
+        start = since.toordinal() if since is not None else None
+        stop = until.toordinal() + 1 if until is not None else None
+        if {"day", "board"} <= self._indexed:
+            entries = self.backend.index_range("day", start, stop)
+            if board is not None:
+                ids = self.backend.index_get("board", board)
+                entries = (entry for entry in entries if entry[1] in ids)
+        else:
+            entries = sorted((key, item.id) for name in ([board] if board is not None else self.boards)
+                             for item in self.backend.iter_board(name) for key in INDEXES["day"](name, item)
+                             if (start is None or key >= start) and (stop is None or key < stop))
+        day, results = None, []
+        for key, id in entries:
+            if offset:
+                offset -= 1
+                continue
+            if limit is not None:
+                if limit == 0:
+                    break
+                limit -= 1
+            if key != day:
+                if results:
+                    yield datetime.date.fromordinal(day), results
+                day, results = key, []
+            results.append(self.backend.get_item(id))
+        if results:
+            yield datetime.date.fromordinal(day), results
+
+    def count_flags(self):
+        """Get a tuple of the amounts of ticked, marked and starred items."""
+        if "flag" not in self._indexed:
+            return self.backend.count_flags()
+        return tuple(len(self.backend.index_get("flag", flag)) for flag in ("tick", "mark", "star"))
+
+    def search(self, text, tag=None, board=None):
+        """Find the items which contain every word of `text` in their text or tag.
+
+        Arguments:
+            text {str} -- words to search for
+            tag {str} -- only find the items with this tag
+            board {str} -- only find the items on this board
+
+        Returns:
+            list -- tuples of board name and item, sorted by item id
+        """
+        terms = words(text)
+        if not terms:
+            return []
+        if not {"term", "tag", "board"} <= self._indexed:
+            # the indexes of a store written by an older version are built when it is first written
+            return self._scan(terms, tag, board)
+        ids = [self.backend.index_get("term", term) for term in terms]
+        if tag is not None:
+            ids.append(self.backend.index_get("tag", tag))
+        if board is not None:
+            ids.append(self.backend.index_get("board", board))
+        # intersect starting from the smallest set
+        ids.sort(key=len)
+        found = set(ids[0]).intersection(*ids[1:])
+        return [self.backend.get_item(id) for id in sorted(found)]
+
+    def _scan(self, terms, tag=None, board=None):
+        # search by checking every item
+        found = []
+        for name in ([board] if board is not None else self.boards):
+            for item in self.backend.iter_board(name):
+                if (tag is None or item.tag == tag) and terms <= INDEXES["term"](name, item):
+                    found.append((name, item))
+        found.sort(key=lambda result: result[1].id)
+        return found
+
+    def query(self, predicates):
+        """Find the items matching predicates on their flags, tags and boards (see `index.parse_query`).
+
+        Returns:
+            list -- tuples of board name and item, sorted by item id
+        """
+        groups = parse_query(predicates)
+        if not {"tag", "board", "flag"} <= self._indexed:
+            return self._scan_query(groups)
+        found = set()
+        for group in groups:
+            found |= self._query_group(group)
+        return [self.backend.get_item(id) for id in sorted(found)]
+
+    def _query_group(self, group):
+        # intersect the ids of the predicates, then subtract the ids of the negated predicates
+        included = sorted((self.backend.index_get(name, key) for name, key, negated in group if not negated), key=len)
+        excluded = [self.backend.index_get(name, key) for name, key, negated in group if negated]
+        if included:
+            ids = set(included[0]).intersection(*included[1:])
+        else:
+            # only negated predicates, start from every item
+            ids = set().union(*(self.backend.index_get("board", board) for board in self.boards))
+        for other in excluded:
+            ids -= other
+        return ids
+
+    def _scan_query(self, groups):
+        # query by checking every item
+        found = []
+        for board in self.boards:
+            for item in self.backend.iter_board(board):
+                if any(all((key in INDEXES[name](board, item)) != negated for name, key, negated in group) for group in groups):
+                    found.append((board, item))
+        found.sort(key=lambda result: result[1].id)
+        return found
+
+    def due_items(self, start=None, stop=None):
+        """Get the items which are not ticked and due in a range of time, through the due date index.
+
+        Arguments:
+            start {int} -- timestamp of the start of the range (inclusive)
+            stop {int} -- timestamp of the end of the range (exclusive)
+
+        Returns:
+            list -- tuples of board name and item, sorted by due date and id
+        """
+        if not {"due", "flag"} <= self._indexed:
+            found = [(board, item) for board in self.boards for item in self.backend.iter_board(board)
+                     if item.due and not item.tick and (start is None or item.due >= start) and (stop is None or item.due < stop)]
+            found.sort(key=lambda result: (result[1].due, result[1].id))
+            return found
+        # check the tick of every item in the range, instead of getting all ticked ids (which sqlite would read every time)
+        found = (self.backend.get_item(id) for _, id in self.backend.index_range("due", start, stop))
+        return [(board, item) for board, item in found if not item.tick]
 
     def get_all_items(self):
         items = []
-        for board in self.shelf:
-            for item in self.shelf[board]:
-                items.append(item)
+        for board in self.boards:
+            items.extend(self.backend.get_board(board))
         return items
 
-    def _add_board(self, board):
+    def _validate_board(self, board):
         if board.strip() == "":
             raise ValueError("Board title must not be empty.")
-        if board in self.shelf.keys():
-            raise KeyError("Board already exists.")
-        logger.debug("Added Board: '{}'".format(board))
-        self.shelf[board] = []  # register board by adding an empty list
+        if board.startswith(META_PREFIX):
+            raise ValueError("Board title must not start with a null character.")
 
     def _add_item(self, id, board, text):
-        date, timestamp = get_time()
-        payload = {
-            "id": id,           # int
-            "text": text,       # str
-            "time": timestamp,  # int
-            "date": date,       # str
-            "due": None,        # int
-            "tick": False,      # bool
-            "mark": False,      # bool
-            "star": False,      # bool
-            "tag": ""           # str
-        }
-        self.shelf[board].append(payload)
-        logger.debug("Added Item: {} to Board: '{}'".format(json.dumps(payload), board))
+        payload = Item(id, text, get_time()[1])
+        self._apply(["insert", board, payload])
+        logger.debug("Added Item: {} to Board: '{}'".format(json.dumps(payload.to_dict()), board))
         return payload
 
     def add_item(self, board, text):
         """[Action]
         * Can be Undone: Yes
-        Prepare data to be dumped into the shelf.
+        Prepare data to be dumped into the storage.
         If the specified board not found, it automatically creates and initialise a new board.
         This method passes the prepared dictionary data to self._add_item to encrypt it and really add it to the board.
         
         Returns:
-            dict -- data of the added item
+            Item -- the added item
         """
-        current_id = 1
-        # get all existing ids
-        ids = list(sorted(self.items.keys()))
-        if ids:
-            current_id = ids[-1] + 1
         # board name
         board = board or DEFAULT_BOARD
-        # add
-        if board not in self.shelf:
-            # create board
-            self._add_board(board)
+        self._validate_board(board)
         # add item
-        return self._add_item(current_id, board, text)
+        return self._add_item(self._next_id(), board, text)
+
+    def add_items(self, items, batch_size=1000):
+        """[Action]
+        * Can be Undone: Yes
+        Add many items at once. Their ids are allocated in batches and their attributes are set when they are inserted.
+
+        Arguments:
+            items {iterable} -- dictionaries of the text of an item, and optionally
+                                the name of its board, its tag, its due date (timestamp) and whether it is starred
+
+        Returns:
+            int -- the amount of items added
+        """
+        count = 0
+        batch = []
+        for data in items:
+            if not isinstance(data.get("text"), str) or not data["text"].strip():
+                raise ValueError("Text must not be empty")
+            board = data.get("board") or DEFAULT_BOARD
+            self._validate_board(board)
+            batch.append((board, data))
+            if len(batch) == batch_size:
+                count += self._add_batch(batch)
+                batch = []
+        if batch:
+            count += self._add_batch(batch)
+        logger.debug("Added {} Items".format(count))
+        return count
+
+    def _add_batch(self, batch):
+        now = get_time()[1]
+        for id, (board, data) in zip(self._allocate_ids(len(batch)), batch):
+            item = Item(id, data["text"], now, data.get("due"), star=bool(data.get("star")), tag=data.get("tag") or "")
+            self._apply(["insert", board, item])
+        return len(batch)
 
     def remove_item(self, id):
         """[Action]
@@ -245,24 +1011,14 @@ class Storage:
         Remove an existing item from board.
 
         Returns:
-            dict -- data of the removed item
+            Item -- the removed item
             str -- board name of the regarding board of the removed item
         """
-        status = False
-        for board in self.shelf:
-            for item in self.shelf[board]:
-                if item["id"] == id:
-                    # remove
-                    self.shelf[board].remove(item)
-                    removed = item
-                    board_of_removed = board
-                    logger.debug("Removed Item: {} on Board: '{}'".format(json.dumps(item), board))
-                    status = True
-            if len(self.shelf[board]) == 0:
-                del self.shelf[board]
-        if status is False:
-            raise ItemNotFoundError(id)
-        return removed, board_of_removed
+        self.get_item(id)  # try to get -> to test existence of the item
+        _, board, removed = self._apply(["delete", id])
+        logger.debug("Removed Item: {} on Board: '{}'".format(json.dumps(removed), board))
+        removed = Item.from_dict(removed)
+        return removed, board
     
     def clear_board(self, board=None):
         """[Action]
@@ -273,42 +1029,43 @@ class Storage:
             int -- total amount of items removed
         """
         if not board:
-            amt = len(self.items)
-            # remove all items of all boards
-            self.shelf.clear()
+            amt = self.total
+            # remove all items of all boards, from the last item of each board which is the cheapest to delete
+            for item in reversed(self.get_all_items()):
+                self._apply(["delete", item.id])
             logger.debug("Cleared all {} Items".format(amt))
         else:
             # remove
-            if board not in self.shelf:
-                raise BoardNotFoundError(board)
-            amt = len(self.shelf[board])
-            del self.shelf[board]
+            items = self.get_board(board)
+            amt = len(items)
+            for item in reversed(items):
+                self._apply(["delete", item.id])
             logger.debug("Cleared {} Items on Board: '{}'".format(amt, board))
         return amt
 
     def modify_item(self, id, key, value):
         """[Action]
-        * Can be Undone: Partially (only when modifying text)
+        * Can be Undone: Yes
         Modify the data of an item, given its ID.
-        If the item does not have the key, one will be created.
 
         Arguments:
             id {int} -- id of the item you want to modify
-            key {str} -- one of [id, text, time, tick, star, mark, tag]
+            key {str} -- one of [text, time, due, tick, star, mark, tag]
             value -- new value to replace the old value
         
         Returns:
-            dict -- the item before modification
+            Item -- the item before modification
         """
-        item = self.get_item(id)
-        old = item.copy()
-        item[key] = value
-        logger.debug("Modified Item from {} to {}".format(json.dumps(old), json.dumps(item)))
+        if key == "id" or key not in Item.__slots__:
+            raise ValueError("Item key '{}' cannot be modified".format(key))
+        old = self.get_item(id).copy()
+        self._apply(["update", id, key, value])
+        logger.debug("Modified Item from {} to {}".format(json.dumps(old.to_dict()), json.dumps(self.get_item(id).to_dict())))
         return old
 
     def move_item(self, id, board):
         """[Action]
-        * Can be undone: No
+        * Can be undone: Yes
         Move the whole item to the destination board, given the id of the item and the name of the board.
 
         If the destination board does not exist, one will be created.
@@ -318,95 +1075,204 @@ class Storage:
             board {str} -- name of the destination board
 
         Returns:
-            item {dict} -- the item that is moved
+            item {Item} -- the item that is moved
             b {str} -- the name of board the item originally from
         """
-        for b in self.shelf:
-            for item in self.shelf[b]:
-                if item["id"] == id:
-                    if not self.shelf.get(board):
-                        # register board with a empty list if board not found
-                        self.shelf[board] = []
-                    # append to dest board `board`
-                    self.shelf[board].append(item)
-                    # remove from the current board `b`
-                    self.shelf[b].remove(item)
-                    return item, b
-        raise ItemNotFoundError(id)
+        item = self.get_item(id)
+        self._validate_board(board)
+        _, _, b = self._apply(["move", id, board])
+        return item, b
+
+    def rename_board(self, board, new):
+        """[Action]
+        * Can be Undone: Yes
+        Rename a board, given its current name and the new name.
+        If a board with the new name already exists, the items of both boards are merged.
+
+        Returns:
+            str -- the new name of the board
+        """
+        self.get_board(board)  # try to get -> to test existence of the board
+        self._validate_board(new)
+        if new != board:
+            for item in reversed(self.get_board(board)):
+                self._apply(["move", item.id, new])
+        return new
+
+    def migrate(self, backend):
+        """Copy all boards and items to another storage backend, overwriting its data.
+
+        Arguments:
+            backend {str} -- name of the destination backend
+
+        Returns:
+            int -- total amount of items copied
+        """
+        with Storage(backend) as dest:
+            dest._replace_all(self.get_all_boards())
+            dest.backend.set_meta("next_id", max(self.backend.get_meta("next_id", 1), dest.backend.get_meta("next_id", 1)))
+            return dest.total
 
     @staticmethod
-    def _validate_json(data):
-        keys = ["id", "text", "time", "date", "due", "tick", "mark", "star", "tag"]
-        for board in data:
-            if board.strip() == "":
-                return False
-            # Check for board type (list)
-            if not isinstance(data[board], list):
+    def _validate_item(board, item):
+        keys = ["id", "text", "time", "due", "tick", "mark", "star", "tag"]
+        if board.strip() == "" or board.startswith(META_PREFIX):
+            return False
+        # Check for item type (dictionary)
+        if not isinstance(item, dict):
+            return False
+        # Check for existence of keys
+        for key in keys:
+            if key not in item.keys():
                 return False
-            for item in data[board]:
-                # Check for item type (dictionary)
-                if not isinstance(item, dict):
-                    return False
-                # Check for existence of keys
-                for key in keys:
-                    if key not in item.keys():
-                        return False
-                # Automatically make one from supplied timestamp if date is not supplied
-                if not item["date"] and item["time"]:
-                    item["date"] = to_datetime(float(item["time"])).strftime("%a %d %b %Y")
-        return True
+        # Check for types of values (bool is a subclass of int)
+        if not isinstance(item["id"], int) or isinstance(item["id"], bool) or not isinstance(item["text"], str):
+            return False
+        if item["time"] is not None and (not isinstance(item["time"], (int, float)) or isinstance(item["time"], bool)):
+            return False
+        if item["due"] is not None and (not isinstance(item["due"], int) or isinstance(item["due"], bool)):
+            return False
+        if not all(isinstance(item[key], bool) for key in ("tick", "mark", "star")):
+            return False
+        return isinstance(item["tag"], str)
+
+    def _allocate_ids(self, amount):
+        """Allocate a range of new item ids at once."""
+        self._check_writable()
+        id = self.backend.get_meta("next_id", 1)
+        self.backend.set_meta("next_id", id + amount)
+        return range(id, id + amount)
+
+    @staticmethod
+    def _read_archive(f):
+        # iterate over the boards and items of an archive, turning errors of reading it into NoteboardException
+        from .archive import iter_archive
+        try:
+            yield from iter_archive(f)
+        except json.JSONDecodeError:
+            raise NoteboardException("Failed to decode JSON")
+        except ValueError:
+            raise NoteboardException("Invalid JSON structure for noteboard")
+        except (OSError, EOFError):
+            raise NoteboardException("Failed to decompress the file")
+
+    def _import_batch(self, batch, merge):
+        # insert a batch of validated items, with new ids if they are merged
+        ids = self._allocate_ids(len(batch)) if merge else None
+        for i, (board, item) in enumerate(batch):
+            item = Item.from_dict(item)
+            if merge:
+                item.id = ids[i]
+            self._apply(["insert", board, item])
+        return len(batch)
 
-    def import_(self, path):
+    def import_(self, path, merge=False, progress=None, batch_size=1000):
         """[Action]
         * Can be Undone: Yes
-        Import and load a local file (json) and overwrite the current boards.
+        Import and load a local file (json) of any format of `export` and overwrite the current boards, or merge its boards into the current ones.
+        The file is read, validated and written in batches of items, without loading it into memory at once.
+        All changes are rolled back if the file turns out to be invalid.
 
         Arguments:
             path {str} -- path to the archive file
-        
+            merge {bool} -- add the items to the current boards with new ids instead of overwriting the boards
+            progress {function} -- called with the amount of items imported so far after every batch
+            batch_size {int} -- amount of items in a batch
+
         Returns:
             path {str} -- full path of the imported file
         """
+        from .archive import open_archive
         path = os.path.abspath(path)
         try:
-            with open(path, "r") as f:
-                data = json.load(f)
+            f = open_archive(path)
         except FileNotFoundError:
             raise NoteboardException("File not found ({})".format(path))
-        except json.JSONDecodeError:
-            raise NoteboardException("Failed to decode JSON")
-        else:
-            if self._validate_json(data) is False:
-                raise NoteboardException("Invalid JSON structure for noteboard")
-            # Overwrite the current shelf and update it
-            self.shelf.clear()
-            self.shelf.update(dict(data))
-            return path
+        with f, self.transaction():
+            if not merge:
+                # Overwrite the current boards, from the last item of each board which is the cheapest to delete
+                for board in self.boards:
+                    for item in reversed(self.backend.get_board(board)):
+                        self._apply(["delete", item.id])
+            seen = set()
+            count = 0
+            batch = []
+            for board, item in self._read_archive(f):
+                if not self._validate_item(board, item) or item["id"] in seen:
+                    raise NoteboardException("Invalid JSON structure for noteboard (item {} on board '{}')".format(item.get("id") if isinstance(item, dict) else item, board))
+                if not merge:
+                    seen.add(item["id"])
+                batch.append((board, item))
+                if len(batch) == batch_size:
+                    count += self._import_batch(batch, merge)
+                    batch = []
+                    if progress is not None:
+                        progress(count)
+            if batch:
+                count += self._import_batch(batch, merge)
+                if progress is not None:
+                    progress(count)
+            if seen:
+                self._bump_next_id(max(seen) + 1)
+        return path
     
-    def export(self, dest="./board.json"):
+    def export(self, dest="./board.json", format="pretty", compress=False):
         """[Action]
         * Can be Undone: No
-        Exoport the current shelf as a JSON file to `dest`.
+        Exoport the current boards as a JSON file to `dest`.
+        Items are written one by one, so that the boards are never copied into memory as a whole.
 
         Arguments:
             dest {str} -- path of the destination
-        
+            format {str} -- one of `archive.FORMATS`
+            compress {bool} -- compress the file with gzip
+
         Returns:
             path {str} -- full path of the exported file
         """
+        from .archive import open_archive, write_archive
         dest = os.path.abspath(dest)
-        data = dict(self.shelf)
-        with open(dest, "w") as f:
-            json.dump(data, f, indent=4, sort_keys=True)
+        names = sorted(self.boards) if format == "pretty" else self.boards
+        boards = ((board, (item.to_dict() for item in self.backend.iter_board(board))) for board in names)
+        with open_archive(dest, "w", compress=compress) as f:
+            write_archive(f, boards, format)
         return dest
 
+    @contextmanager
+    def transaction(self):
+        """Group all actions inside the context into a single history entry, which is undone as a unit.
+
+        Actions are rolled back if an exception is raised inside the context.
+        """
+        if self._transaction is not None:
+            # already in a transaction
+            yield self
+            return
+        self._transaction = []
+        self.history.save()
+        try:
+            yield self
+        except BaseException:
+            ops, self.history.buffer = self.history.buffer, None
+            logger.debug("Rolling back {} operations".format(len(ops)))
+            for op in reversed(ops):
+                self._apply(op)
+            raise
+        else:
+            if self._transaction:
+                actions = [action for action, _ in self._transaction]
+                info = "; ".join(info for _, info in self._transaction)
+                self.history.write(actions[0], info)
+            self.history.buffer = None
+        finally:
+            self._transaction = None
+
     def save_history(self):
-        data = {}
-        for board in self.shelf:
-            data[board] = []
-            for item in self.shelf[board]:
-                data[board].append(item.copy())
-        self.history.save(data)
+        if self._transaction is None:
+            self.history.save()
 
     def write_history(self, action, info):
-        self.history.write(action, info)
+        if self._transaction is not None:
+            self._transaction.append((action, info))
+        else:
+            self.history.write(action, info)
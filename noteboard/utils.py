@@ -1,6 +1,6 @@
+import os
 import time
 import datetime
-import os
 import json
 import logging
 
@@ -8,6 +8,10 @@ import logging
 DEFAULT = {
     "StoragePath": "~/.noteboard/",
     "DefaultBoardName": "Board",
+    "StorageBackend": "shelve",
+    "HistoryMaxEntries": None,
+    "HistoryMaxDays": None,
+    "HistoryMaxBytes": None,
     "Tags": {
         "default": "BLUE",
     }
@@ -31,10 +35,10 @@ def to_datetime(ts):
     return datetime.date.fromtimestamp(ts)  # datetime instance
 
 
-def time_diff(ts, reverse=False):
-    """Get the time difference between the given timestamp and the current time."""
+def time_diff(ts, reverse=False, now=None):
+    """Get the time difference between the given timestamp and the current time (or `now`)."""
     date = datetime.datetime.fromtimestamp(ts)
-    now = datetime.datetime.fromtimestamp(get_time()[1])
+    now = now or datetime.datetime.fromtimestamp(get_time()[1])
     if reverse:
         return date - now  # datetime instance
     return now - date  # datetime instance
@@ -47,9 +51,25 @@ def add_date(days):
     return date  # datetime instance
 
 
+def sync_dir(path):
+    """Sync a directory to the disk, so that files created, renamed or removed in it survive a crash."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # e.g. on Windows, where directories cannot be opened
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
 def setup_logger(path):
     formatter = logging.Formatter("%(asctime)s [%(levelname)s] (%(funcName)s in %(filename)s) %(message)s", "")
-    handler = logging.FileHandler(path, mode="a+")
+    # the log file is not opened until the first record is written
+    handler = logging.FileHandler(path, mode="a+", delay=True)
     handler.setLevel(logging.DEBUG)
     handler.setFormatter(formatter)
 
@@ -60,17 +80,17 @@ def setup_logger(path):
     return logger
 
 
-def init_config(path):
-    """Initialise configurations file. If file already exists, it will be overwritten."""
-    with open(path, "w+") as f:
-        json.dump(DEFAULT, f, sort_keys=True, indent=4)
+def save_config(path, config):
+    """Save configurations to file, overwriting the existing one."""
+    with open(path, "w") as f:
+        json.dump(config, f, sort_keys=True, indent=4)
 
 
 def load_config(path):
-    """Load configurations file. If file does not exist, call `init_config()`."""
-    if not os.path.isfile(path):
-        init_config(path)
-
-    with open(path, "r+") as f:
-        config = json.load(f)
+    """Load configurations file. If file does not exist, the default configurations are returned without creating it."""
+    try:
+        with open(path, "r") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = json.loads(json.dumps(DEFAULT))  # a copy of the defaults
     return config
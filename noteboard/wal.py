@@ -0,0 +1,90 @@
+import json
+import os
+import logging
+
+from .utils import sync_dir
+
+logger = logging.getLogger("noteboard")
+
+
+class WriteAheadLog:
+    """Append-only log of the operations committed to the storage since its last checkpoint.
+
+    Every commit is a line of JSON holding a sequence number and the operations, which is
+    synced to the disk before `append` returns. A line which does not end with a newline
+    was not completely written, so it is ignored and cut off by `recover`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0  # sequence number of the last commit
+
+    def recover(self, after=0, repair=False):
+        """Read the operations of the commits with sequence numbers greater than `after`.
+
+        Arguments:
+            after {int} -- sequence number of the last commit which has been checkpointed
+            repair {bool} -- cut off an incomplete commit at the end of the log
+
+        Returns:
+            list -- lists of the operations of every commit
+        """
+        self.seq = max(self.seq, after)
+        commits = []
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return commits
+        end = 0  # end of the last complete commit
+        with f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Incomplete commit")
+                    record = json.loads(line.decode("utf-8"))
+                    seq, ops = record["seq"], record["ops"]
+                except (ValueError, KeyError, TypeError):
+                    logger.debug("Ignored the write-ahead log after {} bytes".format(end))
+                    break
+                end += len(line)
+                self.seq = max(self.seq, seq)
+                if seq > after:
+                    commits.append(ops)
+            size = f.seek(0, os.SEEK_END)
+        if repair and end < size:
+            os.truncate(self.path, end)
+        return commits
+
+    def append(self, ops):
+        """Commit operations to the log."""
+        data = (json.dumps({"seq": self.seq + 1, "ops": ops}) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            size = os.fstat(fd).st_size
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+                os.fsync(fd)
+            except OSError:
+                # do not leave a partial line, which would hide the commits after it
+                os.ftruncate(fd, size)
+                raise
+        finally:
+            os.close(fd)
+        if size == 0:
+            # make sure the log itself survives a crash
+            sync_dir(os.path.dirname(self.path))
+        self.seq += 1
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def truncate(self):
+        """Empty the log once its operations have been checkpointed. Sequence numbers keep counting up."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass